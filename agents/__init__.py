@@ -1,6 +1,7 @@
 from .base_agent import BaseAgent
 from .document_classifier import DocumentClassifier, DOCUMENT_TYPES
 from .info_extractor import InfoExtractor, ExtractedInfo
+from .combined_analyzer import CombinedAnalyzer
 from .rag_agent import RAGAgent
 from .action_planner import ActionPlanner, ActionType, ActionPlan
 from .simplifier import Simplifier
@@ -11,6 +12,7 @@ __all__ = [
     "DOCUMENT_TYPES",
     "InfoExtractor",
     "ExtractedInfo",
+    "CombinedAnalyzer",
     "RAGAgent",
     "ActionPlanner",
     "ActionType",
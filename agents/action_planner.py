@@ -3,15 +3,13 @@ Action Planner Agent
 
 Generates action plans based on document analysis.
 """
-import os
-from typing import Dict, Any, List, Optional
+import json
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from dataclasses import dataclass
 from enum import Enum
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from .base_agent import BaseAgent
+from config._compat import DATACLASS_SLOTS
+from .base_agent import BaseAgent, json_schema_format, nullable
 
 
 class ActionType(str, Enum):
@@ -25,7 +23,84 @@ class ActionType(str, Enum):
     URGENT = "URGENT"   # 긴급 조치 필요
 
 
-@dataclass
+# Default action per document type code (see DOCUMENT_TYPES)
+_DOC_TYPE_ACTIONS = {
+    "건강보험료_고지서": ActionType.PAY,
+    "국민연금_안내문": ActionType.NONE,
+    "세금_통지서": ActionType.URGENT,
+    "지방세_고지서": ActionType.PAY,
+    "주민센터_안내문": ActionType.NONE,
+    "복지_안내문": ActionType.NONE,
+    "공과금_고지서": ActionType.PAY,
+    "은행_통지서": ActionType.URGENT,
+    "법원_통지서": ActionType.URGENT,
+    "기타_공공문서": ActionType.CHECK
+}
+
+_ACTION_DESC = {
+    ActionType.NONE: "특별히 할 일 없음 (안내문)",
+    ActionType.PAY: "돈을 내야 함",
+    ActionType.CALL: "전화해서 확인/문의 필요",
+    ActionType.VISIT: "직접 방문 필요",
+    ActionType.CHECK: "추가 확인 필요",
+    ActionType.SUBMIT: "서류 제출 필요",
+    ActionType.URGENT: "긴급하게 처리 필요"
+}
+
+_ACTION_DESC_LIST_STR = "\n".join(
+    f"- {action_type.value}: {desc}" for action_type, desc in _ACTION_DESC.items()
+)
+
+_PLANNER_SYSTEM_PROMPT = f"""당신은 디지털 취약계층을 돕는 친절한 안내원입니다.
+공공문서를 받은 사용자가 무엇을 해야 하는지 단계별로 안내해주세요.
+
+행동 유형 설명:
+{_ACTION_DESC_LIST_STR}
+
+다음 JSON 형식으로만 응답하세요:
+{{
+    "action_type": "행동 유형 (NONE/PAY/CALL/VISIT/CHECK/SUBMIT/URGENT)",
+    "urgency": "긴급도 (LOW/MEDIUM/HIGH)",
+    "steps": [
+        "1단계: 구체적인 행동 설명",
+        "2단계: 다음 행동",
+        ...
+    ],
+    "deadline_info": "기한 정보 (있다면)",
+    "contact_info": "문의처 정보 (있다면)",
+    "what_if_ignore": "이 문서를 무시하면 어떻게 되는지"
+}}
+
+중요 원칙:
+1. 초등학생도 이해할 수 있는 쉬운 말 사용
+2. 각 단계는 하나의 행동만 포함
+3. 구체적인 장소, 전화번호, 시간 포함
+4. 불필요한 걱정을 주지 않으면서도 중요한 정보는 명확히"""
+
+_PLAN_MAX_OUTPUT_TOKENS = 800
+
+_JSON_DECODER = json.JSONDecoder()
+
+# key_info fields sent to the LLM, as (key, label)
+_PLAN_KEY_INFO_FIELDS = (
+    ("amount", "금액"),
+    ("due_date", "기한"),
+    ("organization", "발송 기관"),
+    ("penalty_risk", "불이익 위험"),
+    ("contact", "연락처")
+)
+
+_PLANNER_PROPERTIES = {
+    "action_type": {"type": "string", "enum": [t.value for t in ActionType]},
+    "urgency": {"type": "string", "enum": ["LOW", "MEDIUM", "HIGH"]},
+    "steps": {"type": "array", "items": {"type": "string"}},
+    "deadline_info": nullable("string"),
+    "contact_info": nullable("string"),
+    "what_if_ignore": {"type": "string"}
+}
+
+
+@dataclass(**DATACLASS_SLOTS)
 class ActionPlan:
     """Represents an action plan for the user."""
     action_type: ActionType
@@ -50,6 +125,8 @@ class ActionPlanner(BaseAgent):
     Creates step-by-step instructions for users.
     """
     
+    response_format = json_schema_format("action_plan", _PLANNER_PROPERTIES)
+    
     def __init__(self):
         super().__init__()
     
@@ -86,6 +163,101 @@ class ActionPlanner(BaseAgent):
         
         return result
     
+    async def process_async(
+        self,
+        doc_type: str,
+        key_info: Dict[str, Any],
+        rag_context: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Async variant of process()."""
+        action_type = self._determine_action_type(doc_type, key_info)
+        urgency = self._determine_urgency(key_info)
+        
+        system_prompt, user_prompt = self._build_prompts(
+            doc_type, key_info, action_type, urgency, rag_context
+        )
+        result = await self._acall_llm_json(
+            system_prompt, user_prompt, max_tokens=_PLAN_MAX_OUTPUT_TOKENS
+        )
+        
+        return self._ensure_fields(result, action_type, urgency)
+    
+    async def stream_plan(
+        self,
+        doc_type: str,
+        key_info: Dict[str, Any],
+        rag_context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate an action plan, yielding parts as soon as they are known.
+        
+        Urgency is rule-based, so it is yielded before the LLM call; each
+        step is yielded once its JSON string is complete. The final result
+        is authoritative.
+        
+        Yields:
+            {"partial": True, "field": ..., "value": ...} events, then
+            {"partial": False, "result": <same dict as process_async()>}
+        """
+        action_type = self._determine_action_type(doc_type, key_info)
+        urgency = self._determine_urgency(key_info)
+        yield {"partial": True, "field": "urgency", "value": urgency}
+        
+        system_prompt, user_prompt = self._build_prompts(
+            doc_type, key_info, action_type, urgency, rag_context
+        )
+        n_steps = 0
+        async for buffer, result in self._acall_llm_json_stream(
+            system_prompt, user_prompt, max_tokens=_PLAN_MAX_OUTPUT_TOKENS
+        ):
+            if result is not None:
+                break
+            steps = self._completed_steps(buffer)
+            for step in steps[n_steps:]:
+                yield {"partial": True, "field": "steps", "index": n_steps, "value": step}
+                n_steps += 1
+        
+        yield {"partial": False, "result": self._ensure_fields(result, action_type, urgency)}
+    
+    def plan_outline(self, doc_type: str, key_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rule-based part of the action plan, available without an LLM call.
+        
+        Returns:
+            {"action_type": ..., "urgency": ...} as in process() results
+        """
+        return {
+            "action_type": self._determine_action_type(doc_type, key_info).value,
+            "urgency": self._determine_urgency(key_info)
+        }
+    
+    @staticmethod
+    def _completed_steps(buffer: str) -> List[str]:
+        """Return the steps whose JSON strings are complete in a partial response."""
+        start = buffer.find('"steps"')
+        if start < 0:
+            return []
+        pos = buffer.find("[", start)
+        if pos < 0:
+            return []
+        
+        steps = []
+        pos += 1
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer) or buffer[pos] != '"':
+                break
+            try:
+                step, pos = _JSON_DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                # String still being streamed
+                break
+            steps.append(step)
+        
+        return steps
+    
     def _determine_action_type(
         self, 
         doc_type: str, 
@@ -106,19 +278,13 @@ class ActionPlanner(BaseAgent):
             return ActionType.CHECK
         
         # Document type specific logic
-        doc_type_lower = doc_type.lower()
-        
-        if "고지서" in doc_type_lower or "납부" in doc_type_lower:
-            if key_info.get("amount"):
-                return ActionType.PAY
+        action_type = _DOC_TYPE_ACTIONS.get(doc_type, ActionType.CHECK)
         
-        if "통지서" in doc_type_lower or "체납" in doc_type_lower:
-            return ActionType.URGENT
-        
-        if "안내문" in doc_type_lower:
-            return ActionType.NONE
+        # A bill without an amount can't be paid yet
+        if action_type == ActionType.PAY and not key_info.get("amount"):
+            return ActionType.CHECK
         
-        return ActionType.CHECK
+        return action_type
     
     def _determine_urgency(self, key_info: Dict[str, Any]) -> str:
         """Determine urgency level."""
@@ -142,60 +308,48 @@ class ActionPlanner(BaseAgent):
         rag_context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Generate detailed action plan using LLM."""
+        system_prompt, user_prompt = self._build_prompts(
+            doc_type, key_info, action_type, urgency, rag_context
+        )
+        result = self._call_llm_json(
+            system_prompt, user_prompt, max_tokens=_PLAN_MAX_OUTPUT_TOKENS
+        )
+        
+        return self._ensure_fields(result, action_type, urgency)
+    
+    def _build_prompts(
+        self,
+        doc_type: str,
+        key_info: Dict[str, Any],
+        action_type: ActionType,
+        urgency: str,
+        rag_context: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for action planning."""
         
         context_str = ""
         if rag_context and rag_context.get("summary"):
             context_str = f"\n참고 정보: {rag_context['summary']}"
         
-        system_prompt = """당신은 디지털 취약계층을 돕는 친절한 안내원입니다.
-공공문서를 받은 사용자가 무엇을 해야 하는지 단계별로 안내해주세요.
-
-다음 JSON 형식으로만 응답하세요:
-{
-    "action_type": "행동 유형 (NONE/PAY/CALL/VISIT/CHECK/SUBMIT/URGENT)",
-    "urgency": "긴급도 (LOW/MEDIUM/HIGH)",
-    "steps": [
-        "1단계: 구체적인 행동 설명",
-        "2단계: 다음 행동",
-        ...
-    ],
-    "deadline_info": "기한 정보 (있다면)",
-    "contact_info": "문의처 정보 (있다면)",
-    "what_if_ignore": "이 문서를 무시하면 어떻게 되는지"
-}
+        user_prompt = f"""이 문서를 받은 사람이 무엇을 해야 하는지 단계별로 안내해주세요.
 
-중요 원칙:
-1. 초등학생도 이해할 수 있는 쉬운 말 사용
-2. 각 단계는 하나의 행동만 포함
-3. 구체적인 장소, 전화번호, 시간 포함
-4. 불필요한 걱정을 주지 않으면서도 중요한 정보는 명확히"""
-
-        action_desc = {
-            ActionType.NONE: "특별히 할 일 없음 (안내문)",
-            ActionType.PAY: "돈을 내야 함",
-            ActionType.CALL: "전화해서 확인/문의 필요",
-            ActionType.VISIT: "직접 방문 필요",
-            ActionType.CHECK: "추가 확인 필요",
-            ActionType.SUBMIT: "서류 제출 필요",
-            ActionType.URGENT: "긴급하게 처리 필요"
-        }
-
-        user_prompt = f"""문서 유형: {doc_type}
-예상 행동 유형: {action_desc.get(action_type, "확인 필요")}
+문서 유형: {doc_type}
+예상 행동 유형: {action_type.value}
 긴급도: {urgency}
 
 핵심 정보:
-- 금액: {key_info.get('amount', '없음')}
-- 기한: {key_info.get('due_date', '없음')}
-- 발송 기관: {key_info.get('organization', '알 수 없음')}
-- 불이익 위험: {key_info.get('penalty_risk', 'NONE')}
-- 연락처: {key_info.get('contact', '없음')}
-{context_str}
-
-이 문서를 받은 사람이 무엇을 해야 하는지 단계별로 안내해주세요."""
+{self._format_key_info(key_info, _PLAN_KEY_INFO_FIELDS) or "- 없음"}
+{context_str}"""
 
-        result = self._call_llm_json(system_prompt, user_prompt)
-        
+        return _PLANNER_SYSTEM_PROMPT, user_prompt
+    
+    def _ensure_fields(
+        self,
+        result: Dict[str, Any],
+        action_type: ActionType,
+        urgency: str
+    ) -> Dict[str, Any]:
+        """Fill in defaults for missing action plan fields."""
         # Ensure required fields
         if "steps" not in result or not result["steps"]:
             result["steps"] = ["이 문서에 대해 추가 확인이 필요합니다."]
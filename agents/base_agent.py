@@ -3,19 +3,143 @@ Base Agent Module
 
 Provides base class for all LLM-powered agents.
 """
-import os
-from typing import Dict, Any, Optional, List
+import asyncio
+import atexit
+import importlib.util
+import json
+import weakref
+from typing import Dict, Any, Optional, List, AsyncIterator, Sequence, Tuple
 from abc import ABC, abstractmethod
-from openai import OpenAI
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+import orjson
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
 from config import settings
+from .response_cache import get_response_cache, make_cache_key
+
+
+class LoopSemaphore:
+    """
+    An asyncio.Semaphore per running event loop, used as `async with`.
+    
+    A plain semaphore binds to the first loop that waits on it, so a
+    module-level one fails under the next asyncio.run(). The limit applies
+    per loop.
+    """
+    
+    def __init__(self, value: int):
+        self.value = value
+        self._semaphores = weakref.WeakKeyDictionary()
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.value)
+        return semaphore
+    
+    async def __aenter__(self):
+        await self._semaphore().acquire()
+    
+    async def __aexit__(self, *exc_info):
+        self._semaphore().release()
+
+
+# Limits concurrent in-flight LLM requests across all agents
+_LLM_SEMAPHORE = LoopSemaphore(settings.llm_max_concurrency)
+
+# Process-wide clients so all agents share one connection pool
+_SHARED_CLIENT: Optional[OpenAI] = None
+_SHARED_ASYNC_CLIENT: Optional[AsyncOpenAI] = None
+
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+# Multiplex requests over one connection when the optional h2 package is installed
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Tokenizer for input truncation; False once loading has failed
+_ENCODER = None
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Stands in for response_format in cache keys of plain-text calls
+_TEXT_RESPONSE_FORMAT = {"type": "text"}
+
+
+def _close_shared_clients():
+    """Close shared clients at interpreter exit."""
+    if _SHARED_CLIENT is not None:
+        _SHARED_CLIENT.close()
+    if _SHARED_ASYNC_CLIENT is not None:
+        try:
+            asyncio.run(_SHARED_ASYNC_CLIENT.close())
+        except Exception:
+            pass
+
+
+atexit.register(_close_shared_clients)
+
+
+def _get_encoder():
+    """Get the tokenizer for the configured model, or None if unavailable."""
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+            
+            try:
+                _ENCODER = tiktoken.encoding_for_model(settings.openai_model)
+            except KeyError:
+                _ENCODER = tiktoken.get_encoding("o200k_base")
+        
+        except Exception:
+            # tiktoken missing, or its BPE file could not be downloaded
+            _ENCODER = False
+    return _ENCODER or None
+
+
+def nullable(json_type: str) -> Dict[str, Any]:
+    """JSON schema for a value of json_type that may also be null."""
+    return {"type": [json_type, "null"]}
+
+
+def json_schema_format(name: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a strict json_schema response_format.
+    
+    Strict mode requires every property to be listed as required and no
+    extra properties; optional values are expressed with nullable().
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
 
 
 class BaseAgent(ABC):
     """Base class for all agents in the document analysis pipeline."""
     
+    # Structured output format for _call_llm_json; subclasses set their schema
+    response_format: Optional[Dict[str, Any]] = None
+    
+    # Part of the response cache key; bump when a change outside the prompt
+    # text (post-processing, schema semantics) makes cached results stale
+    prompt_version: str = "1"
+    
+    # Routes requests with the same static prompt prefix to the same
+    # provider-side prompt cache; None leaves routing to the provider
+    prompt_cache_key: Optional[str] = None
+    
     def __init__(self, model: Optional[str] = None):
         """
         Initialize the agent.
@@ -24,19 +148,84 @@ class BaseAgent(ABC):
             model: OpenAI model to use
         """
         self.model = model or settings.openai_model
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = type(self).get_client()
+        self.async_client = type(self).get_async_client()
+    
+    @classmethod
+    def get_client(cls) -> OpenAI:
+        """Get the shared sync OpenAI client, creating it on first use."""
+        global _SHARED_CLIENT
+        if _SHARED_CLIENT is None:
+            _SHARED_CLIENT = OpenAI(
+                api_key=settings.openai_api_key,
+                http_client=DefaultHttpxClient(limits=_HTTP_LIMITS, http2=_HTTP2)
+            )
+        return _SHARED_CLIENT
+    
+    @classmethod
+    def get_async_client(cls) -> AsyncOpenAI:
+        """Get the shared AsyncOpenAI client, creating it on first use."""
+        global _SHARED_ASYNC_CLIENT
+        if _SHARED_ASYNC_CLIENT is None:
+            _SHARED_ASYNC_CLIENT = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                http_client=DefaultAsyncHttpxClient(limits=_HTTP_LIMITS, http2=_HTTP2)
+            )
+        return _SHARED_ASYNC_CLIENT
     
     @abstractmethod
     def process(self, **kwargs) -> Dict[str, Any]:
         """Process input and return results."""
         pass
     
+    async def process_async(self, **kwargs) -> Dict[str, Any]:
+        """
+        Async variant of process().
+        
+        Agents override this to await the LLM directly; the default
+        runs process() in a worker thread so it never blocks the loop.
+        """
+        return await asyncio.to_thread(self.process, **kwargs)
+    
+    def _build_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[Dict]
+    ) -> Dict[str, Any]:
+        """Build chat completion request kwargs."""
+        # Provider-side prompt caching reuses a matching prefix, so agents
+        # keep their system prompt static (a module constant) and put
+        # everything per-document in the user prompt that follows it
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        
+        if response_format:
+            kwargs["response_format"] = response_format
+        
+        if self.prompt_cache_key:
+            # Sent as a raw body field so older SDKs without the parameter work
+            kwargs["extra_body"] = {"prompt_cache_key": self.prompt_cache_key}
+        
+        return kwargs
+    
     def _call_llm(
         self, 
         system_prompt: str, 
         user_prompt: str,
+        max_tokens: int,
         temperature: float = 0.3,
-        max_tokens: int = 2000,
         response_format: Optional[Dict] = None
     ) -> str:
         """
@@ -52,51 +241,322 @@ class BaseAgent(ABC):
         Returns:
             LLM response text
         """
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        kwargs = self._build_request(
+            system_prompt, user_prompt, temperature, max_tokens, response_format
+        )
+        response = self.client.chat.completions.create(**kwargs)
+        return response.choices[0].message.content
+    
+    async def _acall_llm(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.3,
+        response_format: Optional[Dict] = None
+    ) -> str:
+        """
+        Async variant of _call_llm().
         
-        kwargs = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
+        Returns:
+            LLM response text
+        """
+        kwargs = self._build_request(
+            system_prompt, user_prompt, temperature, max_tokens, response_format
+        )
+        async with _LLM_SEMAPHORE:
+            response = await self.async_client.chat.completions.create(**kwargs)
+        return response.choices[0].message.content
+    
+    async def _acall_llm_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.3,
+        response_format: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of _acall_llm().
         
-        if response_format:
-            kwargs["response_format"] = response_format
+        Yields:
+            Response text deltas as they arrive
+        """
+        kwargs = self._build_request(
+            system_prompt, user_prompt, temperature, max_tokens, response_format
+        )
+        async with _LLM_SEMAPHORE:
+            stream = await self.async_client.chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    def _call_llm_text(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.3
+    ) -> str:
+        """
+        Call the LLM for plain text, through the response cache.
         
-        response = self.client.chat.completions.create(**kwargs)
-        return response.choices[0].message.content
+        Returns:
+            LLM response text
+        """
+        cache_key = self._response_cache_key(
+            system_prompt, user_prompt, temperature, _TEXT_RESPONSE_FORMAT
+        )
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached["text"]
+        
+        text = self._call_llm(system_prompt, user_prompt, max_tokens, temperature)
+        if text:
+            self._cache_set(cache_key, {"text": text})
+        return text
+    
+    async def _acall_llm_text(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.3
+    ) -> str:
+        """
+        Async variant of _call_llm_text().
+        
+        Returns:
+            LLM response text
+        """
+        cache_key = self._response_cache_key(
+            system_prompt, user_prompt, temperature, _TEXT_RESPONSE_FORMAT
+        )
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached["text"]
+        
+        text = await self._acall_llm(system_prompt, user_prompt, max_tokens, temperature)
+        if text:
+            self._cache_set(cache_key, {"text": text})
+        return text
     
     def _call_llm_json(
         self,
         system_prompt: str,
         user_prompt: str,
-        temperature: float = 0.2
+        max_tokens: int,
+        temperature: float = 0.2,
+        response_format: Optional[Dict] = None
     ) -> Dict[str, Any]:
         """
         Call LLM and parse JSON response.
         
+        Args:
+            max_tokens: Maximum tokens in response; keep it close to the
+                expected output size
+            response_format: Defaults to the agent's schema, or plain JSON
+                mode if it has none
+        
         Returns:
             Parsed JSON dict
         """
-        import json
+        response_format = response_format or self.response_format or {"type": "json_object"}
+        cache_key = self._response_cache_key(system_prompt, user_prompt, temperature, response_format)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         
         response = self._call_llm(
             system_prompt=system_prompt,
             user_prompt=user_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            response_format=response_format
+        )
+        result = self._parse_json(response)
+        self._cache_set(cache_key, result)
+        return result
+    
+    async def _acall_llm_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.2,
+        response_format: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of _call_llm_json().
+        
+        Returns:
+            Parsed JSON dict
+        """
+        response_format = response_format or self.response_format or {"type": "json_object"}
+        cache_key = self._response_cache_key(system_prompt, user_prompt, temperature, response_format)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        response = await self._acall_llm(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            max_tokens=max_tokens,
             temperature=temperature,
-            response_format={"type": "json_object"}
+            response_format=response_format
+        )
+        result = self._parse_json(response)
+        self._cache_set(cache_key, result)
+        return result
+    
+    async def _acall_llm_json_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float = 0.2,
+        response_format: Optional[Dict] = None
+    ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Streaming variant of _acall_llm_json(); shares its cache entries.
+        
+        Yields:
+            (response so far, None) per delta, then (response, parsed dict).
+            A cache hit yields only ("", cached dict).
+        """
+        response_format = response_format or self.response_format or {"type": "json_object"}
+        cache_key = self._response_cache_key(system_prompt, user_prompt, temperature, response_format)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield "", cached
+            return
+        
+        buffer = ""
+        async for delta in self._acall_llm_stream(
+            system_prompt,
+            user_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            response_format=response_format
+        ):
+            buffer += delta
+            yield buffer, None
+        
+        result = self._parse_json(buffer)
+        self._cache_set(cache_key, result)
+        yield buffer, result
+    
+    @staticmethod
+    def _completed_fields(buffer: str) -> Dict[str, Any]:
+        """Return the top-level fields whose values are complete in a partial JSON object."""
+        fields = {}
+        pos = buffer.find("{")
+        if pos < 0:
+            return fields
+        
+        pos += 1
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            try:
+                key, pos = _JSON_DECODER.raw_decode(buffer, pos)
+                while pos < len(buffer) and buffer[pos] in " \t\r\n:":
+                    pos += 1
+                value, pos = _JSON_DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                # Key or value still being streamed
+                break
+            
+            # A number at the very end may still be growing
+            if pos >= len(buffer):
+                break
+            fields[key] = value
+        
+        return fields
+    
+    @staticmethod
+    def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+        """
+        Truncate text to at most max_tokens model tokens.
+        
+        Korean text is several tokens per character, so a character limit
+        says little about prompt size. Falls back to a character limit if
+        the tokenizer is unavailable.
+        """
+        encoder = _get_encoder()
+        if encoder is None:
+            return text[:max_tokens]
+        
+        tokens = encoder.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # A cut inside a multi-byte character decodes to U+FFFD
+        return encoder.decode(tokens[:max_tokens]).rstrip("\ufffd")
+    
+    @staticmethod
+    def _format_key_info(key_info: Dict[str, Any], fields: Sequence[Tuple[str, str]]) -> str:
+        """
+        Format selected key_info fields for a prompt, one "- label: value" per line.
+        
+        Missing and empty fields are left out rather than spelled as "없음",
+        which keeps prompts short without changing their meaning.
+        
+        Args:
+            key_info: Extracted key information
+            fields: (key, label) pairs in output order
+        """
+        return "\n".join(
+            f"- {label}: {key_info[key]}"
+            for key, label in fields
+            if key_info.get(key) not in (None, "")
         )
+    
+    def _response_cache_key(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        response_format: Dict
+    ) -> str:
+        """
+        Cache key for a completion.
         
+        Namespaced by agent and prompt version so agents (or A/B variants of
+        one agent) never share entries; includes the model so a model change
+        invalidates it.
+        """
+        return make_cache_key(
+            type(self).__name__,
+            self.prompt_version,
+            self.model,
+            str(temperature),
+            json.dumps(response_format, sort_keys=True),
+            system_prompt,
+            user_prompt
+        )
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response."""
+        if not settings.llm_cache_enabled:
+            return None
+        return get_response_cache().get(key)
+    
+    def _cache_set(self, key: str, result: Dict[str, Any]):
+        """Cache a response unless it is a parse failure."""
+        if settings.llm_cache_enabled and "error" not in result:
+            get_response_cache().set(key, result)
+    
+    @staticmethod
+    def _parse_json(response: Optional[str]) -> Dict[str, Any]:
+        """
+        Parse the LLM's JSON response.
+        
+        Structured output guarantees valid JSON, so failure only happens on
+        refusals or truncated output; those are reported, not salvaged.
+        """
+        if not response:
+            return {"error": "Empty response", "raw_response": response}
         try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            # Try to extract JSON from response
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            return orjson.loads(response)
+        except orjson.JSONDecodeError:
             return {"error": "Failed to parse JSON", "raw_response": response}
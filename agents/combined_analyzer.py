@@ -0,0 +1,153 @@
+"""
+Combined Analyzer Agent
+
+Classifies a document and extracts its key information in one LLM call.
+"""
+import asyncio
+from typing import Dict, Any, Optional, Tuple
+
+from .base_agent import BaseAgent, json_schema_format
+from .document_classifier import DocumentClassifier, CLASSIFIER_PROPERTIES, DOC_TYPES_LIST_STR
+from .info_extractor import (
+    InfoExtractor, EXTRACTOR_PROPERTIES, EXTRACT_MAX_INPUT_TOKENS,
+    PENALTY_RISK_LEVELS, URGENCY_RULES
+)
+
+
+_COMBINED_SYSTEM_PROMPT = f"""당신은 한국 공공문서 분류 및 정보 추출 전문가입니다.
+주어진 문서 텍스트를 분석하여 문서 종류를 분류하고, 핵심 정보를 정확하게 추출해주세요.
+
+사용 가능한 문서 유형:
+{DOC_TYPES_LIST_STR}
+
+{URGENCY_RULES}
+
+{PENALTY_RISK_LEVELS}
+
+필드 설명:
+- doc_type: 문서 유형 코드
+- doc_type_name: 문서 유형 이름 (한글)
+- confidence: 0.0~1.0 사이의 분류 확신도
+- organization: 문서를 보낸 기관명
+- amount: 납부해야 할 금액 (원 단위, 없으면 null)
+- due_date: 납부/마감 기한 (YYYY-MM-DD 형식, 없으면 null)
+- action_required: 즉시 조치가 필요한지
+- contact: 문의 연락처
+- account_number: 납부 계좌번호 또는 납부번호
+- recipient_name: 수신인 이름 (있다면)
+- urgency_keywords_found: 발견된 긴급 키워드들
+- reasoning: 분류/추출 근거 간단 설명"""
+
+# Structured output schema: the union of the classifier and extractor fields
+_COMBINED_PROPERTIES = {**CLASSIFIER_PROPERTIES, **EXTRACTOR_PROPERTIES}
+
+# Output holds both agents' fields
+_COMBINED_MAX_OUTPUT_TOKENS = 800
+
+_CLASSIFICATION_FIELDS = ("doc_type", "doc_type_name", "confidence", "organization", "reasoning")
+
+_KEY_INFO_FIELDS = (
+    "amount", "due_date", "organization", "penalty_risk", "action_required",
+    "contact", "account_number", "recipient_name", "urgency_keywords_found", "reasoning"
+)
+
+
+class CombinedAnalyzer(BaseAgent):
+    """
+    Agent that fuses document classification and information extraction.
+    
+    Sends the OCR text once instead of once per agent. Reuses the
+    classifier's keyword hints and semantic cache, and the extractor's
+    rule-based candidates and defaults, so results have the same shape
+    as DocumentClassifier.process() and InfoExtractor.process().
+    """
+    
+    response_format = json_schema_format("document_analysis", _COMBINED_PROPERTIES)
+    
+    def __init__(
+        self,
+        classifier: Optional[DocumentClassifier] = None,
+        extractor: Optional[InfoExtractor] = None
+    ):
+        super().__init__()
+        self.classifier = classifier or DocumentClassifier()
+        self.extractor = extractor or InfoExtractor()
+    
+    def process(self, ocr_text: str, **kwargs) -> Dict[str, Any]:
+        """
+        Classify document and extract key information.
+        
+        Args:
+            ocr_text: Full text extracted from document via OCR
+        
+        Returns:
+            Dict with "classification" and "key_info"
+        """
+        # A keyword or cached classification leaves only extraction to do
+        cached, embedding = self.classifier.quick_classify(ocr_text)
+        if cached is not None:
+            key_info = self.extractor.process(ocr_text=ocr_text, doc_type=cached["doc_type"])
+            return {"classification": cached, "key_info": key_info}
+        
+        system_prompt, user_prompt = self._build_prompts(ocr_text)
+        result = self._call_llm_json(
+            system_prompt, user_prompt, max_tokens=_COMBINED_MAX_OUTPUT_TOKENS
+        )
+        
+        combined = self._split_result(result)
+        self.classifier.remember(ocr_text, combined["classification"], embedding)
+        return combined
+    
+    async def process_async(self, ocr_text: str, **kwargs) -> Dict[str, Any]:
+        """Async variant of process()."""
+        cached, embedding = await asyncio.to_thread(self.classifier.quick_classify, ocr_text)
+        if cached is not None:
+            key_info = await self.extractor.process_async(
+                ocr_text=ocr_text, doc_type=cached["doc_type"]
+            )
+            return {"classification": cached, "key_info": key_info}
+        
+        system_prompt, user_prompt = self._build_prompts(ocr_text)
+        result = await self._acall_llm_json(
+            system_prompt, user_prompt, max_tokens=_COMBINED_MAX_OUTPUT_TOKENS
+        )
+        
+        combined = self._split_result(result)
+        self.classifier.remember(ocr_text, combined["classification"], embedding)
+        return combined
+    
+    def _build_prompts(self, ocr_text: str) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for the fused call."""
+        keyword_matches = self.classifier.keyword_match(ocr_text)
+        candidates_str = self.extractor.rule_candidates(ocr_text)
+        
+        hint = ""
+        if keyword_matches:
+            hint = f"\n\n키워드 분석 결과 가능한 유형: {', '.join(keyword_matches)}"
+        
+        user_prompt = f"""다음 문서를 분류하고 핵심 정보를 추출해주세요.
+
+=== 추출된 후보 정보 ===
+{candidates_str if candidates_str else "없음"}
+
+=== 문서 텍스트 (OCR 추출) ===
+{self._truncate_to_tokens(ocr_text, EXTRACT_MAX_INPUT_TOKENS)}
+==={hint}"""
+
+        return _COMBINED_SYSTEM_PROMPT, user_prompt
+    
+    def _split_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Split the fused response into classifier and extractor results."""
+        classification = {k: result[k] for k in _CLASSIFICATION_FIELDS if k in result}
+        key_info = {k: result[k] for k in _KEY_INFO_FIELDS if k in result}
+        
+        # A failed call must stay visible in both halves, as it does in the
+        # classifier's and extractor's own results, so the defaults filled in
+        # below aren't mistaken for a classification (or cached as one)
+        if "error" in result:
+            classification["error"] = key_info["error"] = result["error"]
+        
+        return {
+            "classification": self.classifier.ensure_fields(classification),
+            "key_info": self.extractor.ensure_fields(key_info)
+        }
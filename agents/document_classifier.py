@@ -3,13 +3,13 @@ Document Classifier Agent
 
 Classifies public documents into specific types.
 """
-import os
-from typing import Dict, Any, List
+import re
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from .base_agent import BaseAgent
+from config import settings
+from .base_agent import BaseAgent, json_schema_format, nullable
+from .response_cache import SemanticCache
 
 
 # Known document types for Korean public documents
@@ -56,6 +56,47 @@ DOCUMENT_TYPES = {
     }
 }
 
+DOC_TYPES_LIST_STR = "\n".join(
+    f"- {key}: {info['description']}" for key, info in DOCUMENT_TYPES.items()
+)
+
+_CLASSIFIER_SYSTEM_PROMPT = f"""당신은 한국 공공문서 분류 전문가입니다.
+주어진 문서 텍스트를 분석하여 문서 종류를 정확히 분류해주세요.
+
+사용 가능한 문서 유형:
+{DOC_TYPES_LIST_STR}
+
+다음 JSON 형식으로만 응답하세요:
+{{
+    "doc_type": "문서 유형 코드",
+    "doc_type_name": "문서 유형 이름 (한글)",
+    "confidence": 0.0~1.0 사이의 확신도,
+    "organization": "발송 기관명 (알 수 있다면)",
+    "reasoning": "분류 근거 간단 설명"
+}}"""
+
+# Issuing organizations recognizable by name, checked in order
+_KNOWN_ORGANIZATIONS = (
+    "국민건강보험공단", "국민연금공단", "국세청", "법원",
+    "행정복지센터", "주민센터", "한국전력공사", "도시가스"
+)
+
+# Distinct, non-overlapping keyword hits needed to classify without the
+# LLM. Two hits still come from single phrases like "아파트 관리비"
+_KEYWORD_ONLY_MIN_HITS = 3
+
+# Token budgets for the classification call
+_CLASSIFY_MAX_INPUT_TOKENS = 2000
+_CLASSIFY_MAX_OUTPUT_TOKENS = 300
+
+CLASSIFIER_PROPERTIES = {
+    "doc_type": {"type": "string", "enum": list(DOCUMENT_TYPES)},
+    "doc_type_name": {"type": "string"},
+    "confidence": {"type": "number"},
+    "organization": nullable("string"),
+    "reasoning": {"type": "string"}
+}
+
 
 class DocumentClassifier(BaseAgent):
     """
@@ -63,9 +104,13 @@ class DocumentClassifier(BaseAgent):
     Uses keyword matching + LLM for accurate classification.
     """
     
+    response_format = json_schema_format("document_classification", CLASSIFIER_PROPERTIES)
+    
     def __init__(self):
         super().__init__()
         self.document_types = DOCUMENT_TYPES
+        self.semantic_cache = SemanticCache("classifier")
+        self._build_keyword_matcher()
     
     def process(self, ocr_text: str, **kwargs) -> Dict[str, Any]:
         """
@@ -77,62 +122,198 @@ class DocumentClassifier(BaseAgent):
         Returns:
             Classification result with doc_type and confidence
         """
-        # Step 1: Quick keyword-based pre-classification
-        keyword_matches = self._keyword_match(ocr_text)
+        # Step 0: Quick keyword-based pre-classification; unambiguous hits skip the LLM
+        keyword_counts = self._keyword_counts(ocr_text)
+        keyword_result = self._keyword_classify(ocr_text, keyword_counts)
+        if keyword_result is not None:
+            return keyword_result
+        
+        # Step 1: Reuse the result for a near-identical document if we have one
+        cached, embedding = self._semantic_lookup(ocr_text)
+        if cached is not None:
+            return cached
         
         # Step 2: LLM-based classification
-        llm_result = self._llm_classify(ocr_text, keyword_matches)
+        llm_result = self._llm_classify(ocr_text, list(keyword_counts))
         
+        self.remember(ocr_text, llm_result, embedding)
         return llm_result
     
-    def _keyword_match(self, text: str) -> List[str]:
-        """Find document types that match keywords in text."""
-        text_lower = text.lower()
-        matches = []
+    async def process_async(self, ocr_text: str, **kwargs) -> Dict[str, Any]:
+        """Async variant of process()."""
+        keyword_counts = self._keyword_counts(ocr_text)
+        keyword_result = self._keyword_classify(ocr_text, keyword_counts)
+        if keyword_result is not None:
+            return keyword_result
+        
+        cached, embedding = await asyncio.to_thread(self._semantic_lookup, ocr_text)
+        if cached is not None:
+            return cached
+        
+        system_prompt, user_prompt = self._build_prompts(ocr_text, list(keyword_counts))
+        result = await self._acall_llm_json(
+            system_prompt, user_prompt, max_tokens=_CLASSIFY_MAX_OUTPUT_TOKENS
+        )
+        result = self.ensure_fields(result)
+        
+        self.remember(ocr_text, result, embedding)
+        return result
+    
+    def quick_classify(self, ocr_text: str):
+        """
+        Classify without the LLM, from keywords or the semantic cache.
         
+        Returns:
+            Tuple of (classification or None, embedding to pass to remember())
+        """
+        result = self._keyword_classify(ocr_text)
+        if result is not None:
+            return result, None
+        return self._semantic_lookup(ocr_text)
+    
+    def _semantic_lookup(self, ocr_text: str):
+        """Look up a cached classification for a similar document."""
+        if not settings.semantic_cache_enabled:
+            return None, None
+        return self.semantic_cache.lookup(ocr_text[:3000], self.model)
+    
+    def remember(self, ocr_text: str, result: Dict[str, Any], embedding):
+        """Remember a classification for similar future documents (non-blocking)."""
+        # No embedding means the lookup failed; storing would fail the same way
+        if settings.semantic_cache_enabled and embedding is not None and "error" not in result:
+            self.semantic_cache.store(ocr_text[:3000], self.model, result, embedding, background=True)
+    
+    def _build_keyword_matcher(self):
+        """Build a single-pass matcher over all document type keywords."""
+        # A keyword may belong to several document types (e.g. 수급)
+        self._keyword_types: Dict[str, List[str]] = {}
         for doc_type, info in self.document_types.items():
             for keyword in info["keywords"]:
-                if keyword in text_lower:
-                    matches.append(doc_type)
-                    break
+                self._keyword_types.setdefault(keyword.lower(), []).append(doc_type)
+        
+        # Hangul has no case; only lowercase the text if a keyword has Latin letters
+        self._needs_lower = any(
+            c.isascii() and c.isalpha() for keyword in self._keyword_types for c in keyword
+        )
         
-        return matches
+        try:
+            import ahocorasick
+            
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self._keyword_types:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+            self._keyword_re = None
+        
+        except ImportError:
+            # Fallback: one regex pass; the lookahead reports overlapping hits
+            self._automaton = None
+            keywords = sorted(self._keyword_types, key=len, reverse=True)
+            self._keyword_re = re.compile(
+                "(?=(" + "|".join(re.escape(k) for k in keywords) + "))"
+            )
+    
+    def keyword_match(self, text: str) -> List[str]:
+        """Find document types that match keywords in text."""
+        return list(self._keyword_counts(text))
+    
+    def _keyword_counts(self, text: str) -> Dict[str, int]:
+        """Count distinct keywords found in text per matching document type."""
+        text_search = text.lower() if self._needs_lower else text
+        
+        if self._automaton is not None:
+            hits = [
+                (end + 1 - len(keyword), end + 1, keyword)
+                for end, keyword in self._automaton.iter(text_search)
+            ]
+        else:
+            hits = [
+                (m.start(), m.start() + len(m.group(1)), m.group(1))
+                for m in self._keyword_re.finditer(text_search)
+            ]
+        
+        # Keywords overlap as substrings (건강보험료 holds 건강보험 and 보험료),
+        # so one word must not count twice: keep the longest hits, leftmost
+        # first, and drop any hit overlapping one already kept
+        found = set()
+        taken = bytearray(len(text_search))
+        for start, end, keyword in sorted(hits, key=lambda hit: (hit[0] - hit[1], hit[0])):
+            if not any(taken[start:end]):
+                taken[start:end] = b"\x01" * (end - start)
+                found.add(keyword)
+        
+        type_counts: Dict[str, int] = {}
+        for keyword in found:
+            for doc_type in self._keyword_types[keyword]:
+                type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
+        
+        # Preserve DOCUMENT_TYPES order
+        return {
+            doc_type: type_counts[doc_type]
+            for doc_type in self.document_types if doc_type in type_counts
+        }
+    
+    def _keyword_classify(
+        self,
+        ocr_text: str,
+        keyword_counts: Optional[Dict[str, int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Classify from keywords alone when the match is unambiguous.
+        
+        Returns:
+            Classification result, or None if the LLM is needed
+        """
+        if keyword_counts is None:
+            keyword_counts = self._keyword_counts(ocr_text)
+        
+        if len(keyword_counts) != 1:
+            return None
+        
+        doc_type, hits = next(iter(keyword_counts.items()))
+        if hits < _KEYWORD_ONLY_MIN_HITS:
+            return None
+        
+        return self.ensure_fields({
+            "doc_type": doc_type,
+            "doc_type_name": doc_type.replace("_", " "),
+            "confidence": 0.9,
+            "organization": self._guess_organization(ocr_text),
+            "reasoning": "키워드 기반 분류"
+        })
+    
+    def _guess_organization(self, text: str) -> str:
+        """Find a well-known issuing organization named in text."""
+        for organization in _KNOWN_ORGANIZATIONS:
+            if organization in text:
+                return organization
+        return "알 수 없음"
     
     def _llm_classify(self, ocr_text: str, keyword_matches: List[str]) -> Dict[str, Any]:
         """Use LLM to classify document."""
+        system_prompt, user_prompt = self._build_prompts(ocr_text, keyword_matches)
+        result = self._call_llm_json(
+            system_prompt, user_prompt, max_tokens=_CLASSIFY_MAX_OUTPUT_TOKENS
+        )
         
-        doc_types_list = "\n".join([
-            f"- {key}: {info['description']}"
-            for key, info in self.document_types.items()
-        ])
-        
-        system_prompt = """당신은 한국 공공문서 분류 전문가입니다.
-주어진 문서 텍스트를 분석하여 문서 종류를 정확히 분류해주세요.
-
-다음 JSON 형식으로만 응답하세요:
-{
-    "doc_type": "문서 유형 코드",
-    "doc_type_name": "문서 유형 이름 (한글)",
-    "confidence": 0.0~1.0 사이의 확신도,
-    "organization": "발송 기관명 (알 수 있다면)",
-    "reasoning": "분류 근거 간단 설명"
-}"""
-
+        return self.ensure_fields(result)
+    
+    def _build_prompts(self, ocr_text: str, keyword_matches: List[str]) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for classification."""
         hint = ""
         if keyword_matches:
             hint = f"\n\n키워드 분석 결과 가능한 유형: {', '.join(keyword_matches)}"
 
         user_prompt = f"""다음 문서를 분류해주세요.
 
-사용 가능한 문서 유형:
-{doc_types_list}
-
 === 문서 텍스트 (OCR 추출) ===
-{ocr_text[:3000]}
+{self._truncate_to_tokens(ocr_text, _CLASSIFY_MAX_INPUT_TOKENS)}
 ==={hint}"""
 
-        result = self._call_llm_json(system_prompt, user_prompt)
-        
+        return _CLASSIFIER_SYSTEM_PROMPT, user_prompt
+    
+    def ensure_fields(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in defaults for missing classification fields."""
         # Ensure required fields exist
         if "doc_type" not in result:
             result["doc_type"] = "기타_공공문서"
@@ -4,18 +4,137 @@ Information Extractor Agent
 Extracts key information from public documents.
 Uses regex + LLM hybrid approach for accurate extraction.
 """
-import os
 import re
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Pattern, Tuple
 from dataclasses import dataclass
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config._compat import DATACLASS_SLOTS
+from .base_agent import BaseAgent, json_schema_format, nullable
 
-from .base_agent import BaseAgent
 
+# Prompt rules for penalty_risk, shared with the combined analyzer
+URGENCY_RULES = """⚠️ 긴급 키워드 감지 우선:
+다음 키워드가 포함되어 있으면 반드시 penalty_risk를 HIGH 또는 MEDIUM으로, action_required를 true로 설정하세요:
+- 독촉, 독촉장, 최고장 → HIGH
+- 체납, 연체, 미납 → HIGH
+- 압류, 압류 예고 → HIGH
+- 독촉(이)왔어, 독촉(이)왔다 → HIGH
+- 과태료, 가산금 → MEDIUM
+- 납부 기한 경과, 기한 초과 → MEDIUM"""
+
+PENALTY_RISK_LEVELS = """penalty_risk 기준:
+- NONE: 안내문으로 불이익 없음
+- LOW: 기한 넘겨도 큰 불이익 없음
+- MEDIUM: 연체료/과태료 발생 가능
+- HIGH: 독촉장/체납/압류 등 즉시 조치 필요, 법적 조치 가능"""
+
+_EXTRACTOR_SYSTEM_PROMPT = f"""당신은 한국 공공문서 정보 추출 전문가입니다.
+문서에서 핵심 정보를 정확하게 추출해주세요.
+
+{URGENCY_RULES}
+
+다음 JSON 형식으로만 응답하세요:
+{{
+    "amount": "납부해야 할 금액 (원 단위, 없으면 null)",
+    "due_date": "납부/마감 기한 (YYYY-MM-DD 형식, 없으면 null)",
+    "organization": "문서를 보낸 기관명",
+    "penalty_risk": "불이익/연체료 위험 (NONE/LOW/MEDIUM/HIGH)",
+    "action_required": true/false (즉시 조치가 필요한지),
+    "contact": "문의 연락처",
+    "account_number": "납부 계좌번호 또는 납부번호",
+    "recipient_name": "수신인 이름 (있다면)",
+    "urgency_keywords_found": ["발견된 긴급 키워드들"],
+    "reasoning": "추출 근거 간단 설명"
+}}
+
+{PENALTY_RISK_LEVELS}"""
 
-@dataclass
+# Token budgets for the extraction call
+EXTRACT_MAX_INPUT_TOKENS = 3000
+_EXTRACT_MAX_OUTPUT_TOKENS = 600
+
+EXTRACTOR_PROPERTIES = {
+    "amount": nullable("string"),
+    "due_date": nullable("string"),
+    "organization": nullable("string"),
+    "penalty_risk": {"type": "string", "enum": ["NONE", "LOW", "MEDIUM", "HIGH"]},
+    "action_required": {"type": "boolean"},
+    "contact": nullable("string"),
+    "account_number": nullable("string"),
+    "recipient_name": nullable("string"),
+    "urgency_keywords_found": {"type": "array", "items": {"type": "string"}},
+    "reasoning": {"type": "string"}
+}
+
+
+def _combine_patterns(
+    patterns: List[str],
+    flags: int = 0
+) -> Tuple[Pattern, Dict[int, Optional[int]]]:
+    """
+    Combine regex patterns into one alternation.
+    
+    Returns:
+        Tuple of (compiled pattern, map of each alternative's outer group
+        index to its first inner group index or None)
+    """
+    parts = []
+    inner_groups = {}
+    group = 1
+    for pattern in patterns:
+        n_groups = re.compile(pattern).groups
+        parts.append(f"({pattern})")
+        inner_groups[group] = group + 1 if n_groups else None
+        group += 1 + n_groups
+    
+    return re.compile("|".join(parts), flags), inner_groups
+
+
+# Regex patterns for common information types, compiled once at import.
+# Each category is combined into a single alternation so the text is
+# scanned once per category instead of once per pattern.
+#
+# Digits are spelled [0-9] rather than \d, which would also match other
+# scripts' digits. re.ASCII is not used for that: it would also narrow \s
+# and miss the NBSP and ideographic spaces OCR produces in Korean text.
+
+# Korean currency amounts
+_AMOUNT_RE, _ = _combine_patterns([
+    r'([0-9]{1,3}(?:,[0-9]{3})*)\s*원',
+    r'₩\s*([0-9]{1,3}(?:,[0-9]{3})*)',
+    r'금\s*([0-9]{1,3}(?:,[0-9]{3})*)\s*원',
+    r'합계[:\s]*([0-9]{1,3}(?:,[0-9]{3})*)\s*원',
+    r'총액[:\s]*([0-9]{1,3}(?:,[0-9]{3})*)\s*원',
+    r'납부금액[:\s]*([0-9]{1,3}(?:,[0-9]{3})*)\s*원',
+])
+
+# Date patterns
+_DATE_RE, _ = _combine_patterns([
+    r'([0-9]{4})[-./년]\s*([0-9]{1,2})[-./월]\s*([0-9]{1,2})일?',
+    r'([0-9]{4})\.([0-9]{2})\.([0-9]{2})',
+    r'납부기한[:\s]*([0-9]{4}[-./][0-9]{1,2}[-./][0-9]{1,2})',
+    r'마감일[:\s]*([0-9]{4}[-./][0-9]{1,2}[-./][0-9]{1,2})',
+    r'기한[:\s]*([0-9]{4}[-./][0-9]{1,2}[-./][0-9]{1,2})',
+])
+
+# Phone number patterns
+_PHONE_RE, _ = _combine_patterns([
+    r'([0-9]{2,4})[-)\s]([0-9]{3,4})[-\s]([0-9]{4})',
+    r'(1[0-9]{3})',  # Special numbers like 1355, 1588
+    r'전화[:\s]*([0-9\-]+)',
+    r'연락처[:\s]*([0-9\-]+)',
+    r'문의[:\s]*([0-9\-]+)',
+])
+
+# Account number patterns (we keep the captured number, not the label)
+_ACCOUNT_RE, _ACCOUNT_GROUPS = _combine_patterns([
+    r'계좌[^0-9]*([0-9]{2,4}[-\s]?[0-9]{2,6}[-\s]?[0-9]{2,6})',
+    r'납부번호[:\s]*([0-9\-]+)',
+    r'가상계좌[:\s]*([0-9\-]+)',
+])
+
+
+@dataclass(**DATACLASS_SLOTS)
 class ExtractedInfo:
     """Represents extracted key information from a document."""
     amount: Optional[str] = None  # 금액
@@ -46,46 +165,7 @@ class InfoExtractor(BaseAgent):
     Uses rule-based extraction + LLM refinement.
     """
     
-    def __init__(self):
-        super().__init__()
-        self._compile_patterns()
-    
-    def _compile_patterns(self):
-        """Compile regex patterns for common information types."""
-        # Korean currency amounts
-        self.amount_patterns = [
-            re.compile(r'(\d{1,3}(?:,\d{3})*)\s*원'),
-            re.compile(r'₩\s*(\d{1,3}(?:,\d{3})*)'),
-            re.compile(r'금\s*(\d{1,3}(?:,\d{3})*)\s*원'),
-            re.compile(r'합계[:\s]*(\d{1,3}(?:,\d{3})*)\s*원'),
-            re.compile(r'총액[:\s]*(\d{1,3}(?:,\d{3})*)\s*원'),
-            re.compile(r'납부금액[:\s]*(\d{1,3}(?:,\d{3})*)\s*원'),
-        ]
-        
-        # Date patterns
-        self.date_patterns = [
-            re.compile(r'(\d{4})[-./년]\s*(\d{1,2})[-./월]\s*(\d{1,2})일?'),
-            re.compile(r'(\d{4})\.(\d{2})\.(\d{2})'),
-            re.compile(r'납부기한[:\s]*(\d{4}[-./]\d{1,2}[-./]\d{1,2})'),
-            re.compile(r'마감일[:\s]*(\d{4}[-./]\d{1,2}[-./]\d{1,2})'),
-            re.compile(r'기한[:\s]*(\d{4}[-./]\d{1,2}[-./]\d{1,2})'),
-        ]
-        
-        # Phone number patterns
-        self.phone_patterns = [
-            re.compile(r'(\d{2,4})[-)\s](\d{3,4})[-\s](\d{4})'),
-            re.compile(r'(1\d{3})'),  # Special numbers like 1355, 1588
-            re.compile(r'전화[:\s]*([\d\-]+)'),
-            re.compile(r'연락처[:\s]*([\d\-]+)'),
-            re.compile(r'문의[:\s]*([\d\-]+)'),
-        ]
-        
-        # Account number patterns
-        self.account_patterns = [
-            re.compile(r'계좌[^\d]*(\d{2,4}[-\s]?\d{2,6}[-\s]?\d{2,6})'),
-            re.compile(r'납부번호[:\s]*([\d\-]+)'),
-            re.compile(r'가상계좌[:\s]*([\d\-]+)'),
-        ]
+    response_format = json_schema_format("key_information", EXTRACTOR_PROPERTIES)
     
     def process(
         self, 
@@ -111,6 +191,26 @@ class InfoExtractor(BaseAgent):
         
         return llm_result
     
+    async def process_async(
+        self,
+        ocr_text: str,
+        doc_type: str = "",
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Async variant of process()."""
+        rule_based = self._extract_with_rules(ocr_text)
+        
+        system_prompt, user_prompt = self._build_prompts(ocr_text, doc_type, rule_based)
+        result = await self._acall_llm_json(
+            system_prompt, user_prompt, max_tokens=_EXTRACT_MAX_OUTPUT_TOKENS
+        )
+        
+        return self.ensure_fields(result)
+    
+    def rule_candidates(self, ocr_text: str) -> str:
+        """Rule-based candidates found in ocr_text, formatted as prompt lines."""
+        return self._format_candidates(self._extract_with_rules(ocr_text))
+    
     def _extract_with_rules(self, text: str) -> Dict[str, List[str]]:
         """Extract candidates using regex patterns."""
         results = {
@@ -120,33 +220,24 @@ class InfoExtractor(BaseAgent):
             "accounts": []
         }
         
-        # Extract amounts
-        for pattern in self.amount_patterns:
-            for match in pattern.finditer(text):
-                amount = match.group(0)
-                if amount not in results["amounts"]:
-                    results["amounts"].append(amount)
-        
-        # Extract dates
-        for pattern in self.date_patterns:
-            for match in pattern.finditer(text):
-                date = match.group(0)
-                if date not in results["dates"]:
-                    results["dates"].append(date)
+        # dict.fromkeys dedupes while keeping first-seen order
+        results["amounts"] = list(dict.fromkeys(
+            m.group(0) for m in _AMOUNT_RE.finditer(text)
+        ))
+        results["dates"] = list(dict.fromkeys(
+            m.group(0) for m in _DATE_RE.finditer(text)
+        ))
+        results["phones"] = list(dict.fromkeys(
+            m.group(0) for m in _PHONE_RE.finditer(text)
+        ))
         
-        # Extract phone numbers
-        for pattern in self.phone_patterns:
-            for match in pattern.finditer(text):
-                phone = match.group(0)
-                if phone not in results["phones"]:
-                    results["phones"].append(phone)
-        
-        # Extract account numbers
-        for pattern in self.account_patterns:
-            for match in pattern.finditer(text):
-                account = match.group(1) if match.lastindex else match.group(0)
-                if account not in results["accounts"]:
-                    results["accounts"].append(account)
+        # The matched alternative's outer group closes last, so lastindex
+        # identifies it; take its first inner capture as the account number
+        accounts = []
+        for m in _ACCOUNT_RE.finditer(text):
+            inner = _ACCOUNT_GROUPS[m.lastindex]
+            accounts.append(m.group(inner) if inner else m.group(0))
+        results["accounts"] = list(dict.fromkeys(accounts))
         
         return results
     
@@ -157,49 +248,22 @@ class InfoExtractor(BaseAgent):
         rule_candidates: Dict[str, List[str]]
     ) -> Dict[str, Any]:
         """Use LLM to refine and select correct information."""
+        system_prompt, user_prompt = self._build_prompts(ocr_text, doc_type, rule_candidates)
+        result = self._call_llm_json(
+            system_prompt, user_prompt, max_tokens=_EXTRACT_MAX_OUTPUT_TOKENS
+        )
         
-        candidates_str = ""
-        if rule_candidates["amounts"]:
-            candidates_str += f"금액 후보: {', '.join(rule_candidates['amounts'][:5])}\n"
-        if rule_candidates["dates"]:
-            candidates_str += f"날짜 후보: {', '.join(rule_candidates['dates'][:5])}\n"
-        if rule_candidates["phones"]:
-            candidates_str += f"연락처 후보: {', '.join(rule_candidates['phones'][:5])}\n"
-        if rule_candidates["accounts"]:
-            candidates_str += f"계좌/납부번호 후보: {', '.join(rule_candidates['accounts'][:3])}\n"
+        return self.ensure_fields(result)
+    
+    def _build_prompts(
+        self,
+        ocr_text: str,
+        doc_type: str,
+        rule_candidates: Dict[str, List[str]]
+    ) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for extraction."""
+        candidates_str = self._format_candidates(rule_candidates)
         
-        system_prompt = """당신은 한국 공공문서 정보 추출 전문가입니다.
-문서에서 핵심 정보를 정확하게 추출해주세요.
-
-⚠️ 긴급 키워드 감지 우선:
-다음 키워드가 포함되어 있으면 반드시 penalty_risk를 HIGH 또는 MEDIUM으로, action_required를 true로 설정하세요:
-- 독촉, 독촉장, 최고장 → HIGH
-- 체납, 연체, 미납 → HIGH
-- 압류, 압류 예고 → HIGH
-- 독촉(이)왔어, 독촉(이)왔다 → HIGH
-- 과태료, 가산금 → MEDIUM
-- 납부 기한 경과, 기한 초과 → MEDIUM
-
-다음 JSON 형식으로만 응답하세요:
-{
-    "amount": "납부해야 할 금액 (원 단위, 없으면 null)",
-    "due_date": "납부/마감 기한 (YYYY-MM-DD 형식, 없으면 null)",
-    "organization": "문서를 보낸 기관명",
-    "penalty_risk": "불이익/연체료 위험 (NONE/LOW/MEDIUM/HIGH)",
-    "action_required": true/false (즉시 조치가 필요한지),
-    "contact": "문의 연락처",
-    "account_number": "납부 계좌번호 또는 납부번호",
-    "recipient_name": "수신인 이름 (있다면)",
-    "urgency_keywords_found": ["발견된 긴급 키워드들"],
-    "reasoning": "추출 근거 간단 설명"
-}
-
-penalty_risk 기준:
-- NONE: 안내문으로 불이익 없음
-- LOW: 기한 넘겨도 큰 불이익 없음
-- MEDIUM: 연체료/과태료 발생 가능
-- HIGH: 독촉장/체납/압류 등 즉시 조치 필요, 법적 조치 가능"""
-
         user_prompt = f"""다음 문서에서 핵심 정보를 추출해주세요.
 
 문서 유형: {doc_type if doc_type else "미확인"}
@@ -208,10 +272,25 @@ penalty_risk 기준:
 {candidates_str if candidates_str else "없음"}
 
 === 문서 텍스트 ===
-{ocr_text[:4000]}"""
+{self._truncate_to_tokens(ocr_text, EXTRACT_MAX_INPUT_TOKENS)}"""
 
-        result = self._call_llm_json(system_prompt, user_prompt)
-        
+        return _EXTRACTOR_SYSTEM_PROMPT, user_prompt
+    
+    def _format_candidates(self, rule_candidates: Dict[str, List[str]]) -> str:
+        """Format rule-based candidates as prompt lines."""
+        candidates_str = ""
+        if rule_candidates["amounts"]:
+            candidates_str += f"금액 후보: {', '.join(rule_candidates['amounts'][:5])}\n"
+        if rule_candidates["dates"]:
+            candidates_str += f"날짜 후보: {', '.join(rule_candidates['dates'][:5])}\n"
+        if rule_candidates["phones"]:
+            candidates_str += f"연락처 후보: {', '.join(rule_candidates['phones'][:5])}\n"
+        if rule_candidates["accounts"]:
+            candidates_str += f"계좌/납부번호 후보: {', '.join(rule_candidates['accounts'][:3])}\n"
+        return candidates_str
+    
+    def ensure_fields(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in defaults for missing extraction fields."""
         # Ensure all fields exist with defaults
         defaults = {
             "amount": None,
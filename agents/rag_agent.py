@@ -3,13 +3,16 @@ RAG Agent Module
 
 Retrieves relevant context from knowledge base.
 """
-import os
-from typing import Dict, Any, List, Optional
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import orjson
 
+from config import settings
 from .base_agent import BaseAgent
+from .document_classifier import DOCUMENT_TYPES
+from .response_cache import TTLCache
 
 
 class RAGAgent(BaseAgent):
@@ -18,19 +21,48 @@ class RAGAgent(BaseAgent):
     Uses vector similarity search.
     """
     
+    prompt_cache_key = "rag_summary_v1"
+    
     def __init__(self, collection_name: str = "doc_helper_knowledge"):
         super().__init__()
         self.collection_name = collection_name
         self._vector_store = None
+        self._vector_store_lock = threading.Lock()
+        
+        # The query only varies by (doc_type, organization, penalty bucket),
+        # so repeated document types are served from memory
+        self._retrieval_cache = TTLCache(settings.rag_cache_size, settings.rag_cache_ttl)
+        self._summary_cache = TTLCache(settings.rag_cache_size, settings.rag_cache_ttl)
     
     @property
     def vector_store(self):
         """Lazy load vector store."""
         if self._vector_store is None:
-            from rag import VectorStore
-            self._vector_store = VectorStore(collection_name=self.collection_name)
+            # warmup() may be initializing it from another thread
+            with self._vector_store_lock:
+                if self._vector_store is None:
+                    from rag import VectorStore
+                    self._vector_store = VectorStore(collection_name=self.collection_name)
         return self._vector_store
     
+    def warmup(self):
+        """Open and load the vector store and embed common queries ahead of the first request (best effort)."""
+        try:
+            self.vector_store.warmup()
+            
+            self.vector_store.cache_query_embeddings(self._common_queries())
+        except Exception:
+            pass
+    
+    def _common_queries(self) -> List[str]:
+        """Search queries for every document type with no organization named."""
+        return [
+            self._build_query(doc_type, {"action_required": action_required, "penalty_risk": penalty_risk})
+            for doc_type in DOCUMENT_TYPES
+            for action_required in (False, True)
+            for penalty_risk in ("LOW", "HIGH")
+        ]
+    
     def process(
         self,
         doc_type: str,
@@ -56,23 +88,16 @@ class RAGAgent(BaseAgent):
         
         # Search vector store
         try:
-            results = self.vector_store.search(query, n_results=top_k)
-            
-            # Format results
-            retrieved_chunks = []
-            for r in results:
-                retrieved_chunks.append({
-                    "text": r.get("text", ""),
-                    "source": r.get("metadata", {}).get("source_name", "Unknown"),
-                    "doc_type": r.get("metadata", {}).get("doc_type", ""),
-                    "topic": r.get("metadata", {}).get("topic", ""),
-                    "score": r.get("score", 0.0)
-                })
+            chunk_ids, retrieved_chunks = self._retrieve(query, top_k)
             
             # Generate summary using LLM if we have results
             summary = ""
             if retrieved_chunks:
-                summary = self._generate_summary(doc_type, key_info, retrieved_chunks)
+                summary_key = (query, chunk_ids)
+                summary = self._summary_cache.get(summary_key)
+                if summary is None:
+                    summary = self._generate_summary(doc_type, key_info, retrieved_chunks)
+                    self._summary_cache.set(summary_key, summary)
             
             return {
                 "retrieved_chunks": retrieved_chunks,
@@ -89,6 +114,100 @@ class RAGAgent(BaseAgent):
                 "error": str(e)
             }
     
+    async def process_async(
+        self,
+        doc_type: str,
+        key_info: Dict[str, Any],
+        ocr_text: str = "",
+        top_k: int = 5,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Async variant of process()."""
+        query = self._build_query(doc_type, key_info)
+        
+        try:
+            # Chroma + embedding lookup is blocking; keep it off the event loop
+            chunk_ids, retrieved_chunks = await asyncio.to_thread(self._retrieve, query, top_k)
+            
+            summary = ""
+            if retrieved_chunks:
+                summary_key = (query, chunk_ids)
+                summary = self._summary_cache.get(summary_key)
+                if summary is None:
+                    system_prompt, user_prompt = self._build_summary_prompts(
+                        doc_type, key_info, retrieved_chunks
+                    )
+                    summary = ""
+                    if user_prompt:
+                        summary = await self._acall_llm_text(system_prompt, user_prompt, max_tokens=300)
+                    self._summary_cache.set(summary_key, summary)
+            
+            return {
+                "retrieved_chunks": retrieved_chunks,
+                "query": query,
+                "summary": summary
+            }
+            
+        except Exception as e:
+            return {
+                "retrieved_chunks": [],
+                "query": query,
+                "summary": "",
+                "error": str(e)
+            }
+    
+    def _retrieve(self, query: str, top_k: int) -> Tuple[Tuple[str, ...], List[Dict[str, Any]]]:
+        """
+        Search the vector store, memoized per query.
+        
+        Returns:
+            Tuple of (chunk ids, formatted chunks)
+        """
+        cache_key = (query, top_k)
+        cached = self._retrieval_cache.get(cache_key)
+        if cached is None:
+            results = self.vector_store.search(query, n_results=top_k)
+            chunk_ids = tuple(r.get("id", "") for r in results)
+            cached = (chunk_ids, self._format_results(results))
+            self._retrieval_cache.set(cache_key, cached)
+        
+        chunk_ids, chunks = cached
+        # Hand out copies so callers can't mutate the cached entries
+        return chunk_ids, [dict(c) for c in chunks]
+    
+    def clear_cache(self):
+        """Drop memoized retrievals and summaries (e.g. after a KB reload)."""
+        self._retrieval_cache.clear()
+        self._summary_cache.clear()
+    
+    def _format_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Format vector store results into evidence chunks."""
+        retrieved_chunks = []
+        for r in results:
+            metadata = r.get("metadata") or {}
+            retrieved_chunks.append({
+                "text": r.get("text", ""),
+                "source": metadata.get("source_name", "Unknown"),
+                "doc_type": metadata.get("doc_type", ""),
+                "topic": metadata.get("topic", ""),
+                "score": r.get("score", 0.0),
+                "action_guide": self._parse_action_guide(metadata.get("action_guide"))
+            })
+        return retrieved_chunks
+    
+    @staticmethod
+    def _parse_action_guide(raw: Any) -> Dict[str, Any]:
+        """Decode an action guide stored as a JSON string in chunk metadata."""
+        if isinstance(raw, dict):
+            return raw
+        if not raw:
+            return {}
+        try:
+            guide = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            return {}
+        return guide if isinstance(guide, dict) else {}
+    
     def _build_query(self, doc_type: str, key_info: Dict[str, Any]) -> str:
         """Build search query from document info."""
         query_parts = [doc_type]
@@ -111,28 +230,51 @@ class RAGAgent(BaseAgent):
         chunks: List[Dict]
     ) -> str:
         """Generate summary from retrieved chunks."""
+        system_prompt, user_prompt = self._build_summary_prompts(doc_type, key_info, chunks)
+        if not user_prompt:
+            return ""
+        
+        return self._call_llm_text(system_prompt, user_prompt, max_tokens=300)
+    
+    def _build_summary_prompts(
+        self,
+        doc_type: str,
+        key_info: Dict[str, Any],
+        chunks: List[Dict]
+    ) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for the summary; empty if no context."""
         
+        # The evidence comes first and in a fixed order, so documents that
+        # retrieve the same chunks share a prompt prefix with the provider's
+        # prompt cache; the per-document fields go last
+        top_chunks = sorted(chunks[:3], key=lambda c: (c['source'], c['text']))
         context = "\n".join([
             f"[{c['source']}] {c['text'][:500]}"
-            for c in chunks[:3]
+            for c in top_chunks
         ])
         
         if not context:
-            return ""
+            return "", ""
         
         system_prompt = """당신은 공공문서 안내 전문가입니다.
 검색된 정보를 바탕으로 사용자에게 도움이 될 요약을 제공하세요.
 쉬운 말로 간결하게 2-3문장으로 요약하세요."""
 
-        user_prompt = f"""문서 유형: {doc_type}
-핵심 정보: {key_info}
-
-관련 참고 정보:
+        # Only the fields that make up the search query, so the summary can be
+        # shared between documents with the same query without leaking
+        # per-document details (amounts, names) across users
+        penalty_risk = key_info.get("penalty_risk") in ["MEDIUM", "HIGH"]
+        user_prompt = f"""관련 참고 정보:
 {context}
 
+문서 유형: {doc_type}
+발송 기관: {key_info.get('organization') or '알 수 없음'}
+즉시 조치 필요: {'예' if key_info.get('action_required') else '아니오'}
+연체 불이익 위험: {'있음' if penalty_risk else '낮음'}
+
 위 정보를 바탕으로 이 문서에 대한 일반적인 안내를 요약해주세요."""
 
-        return self._call_llm(system_prompt, user_prompt, max_tokens=300)
+        return system_prompt, user_prompt
     
     def add_knowledge(
         self,
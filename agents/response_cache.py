@@ -0,0 +1,280 @@
+"""
+Response Cache Module
+
+Caches LLM responses so repeated documents skip the OpenAI round trip.
+
+Two tiers:
+- ResponseCache: exact match on a SHA256 of (model, prompts), stored in SQLite
+- SemanticCache: nearest-neighbour match on the input text's embedding,
+  stored in a ChromaDB collection
+
+TTLCache is a small in-process LRU for cheap, frequently repeated lookups.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Hashable, Optional, List, Tuple
+
+from config import settings
+
+
+# Background semantic cache writes; one worker keeps them off the request
+# path without piling concurrent writers onto ChromaDB
+_STORE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+# Expired entries are only skipped on read, so writers delete them at most
+# this often (seconds); cached results hold names and account numbers
+_PURGE_INTERVAL = 3600
+
+
+def make_cache_key(*parts: str) -> str:
+    """Build a stable cache key from prompt parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache whose entries expire after ttl seconds."""
+    
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value for key, or None if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, value = entry
+            if time.monotonic() > expires_at:
+                del self._data[key]
+                return None
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        """Delete all entries."""
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+    """
+    Exact-match LLM response cache backed by SQLite.
+    
+    Keys are hashes of the full request (model + prompts), so a model
+    change naturally invalidates old entries.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[int] = None):
+        """
+        Initialize the cache.
+        
+        Args:
+            db_path: SQLite file path
+            ttl: Entry lifetime in seconds
+        """
+        self.db_path = db_path or os.path.join(settings.cache_dir, "llm_responses.sqlite3")
+        self.ttl = ttl if ttl is not None else settings.llm_cache_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)"
+        )
+        self._conn.commit()
+        
+        self._next_purge = 0.0
+        self.purge_expired()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for key, or None if missing/expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        
+        if row is None:
+            return None
+        
+        value, created_at = row
+        if self.ttl and time.time() - created_at > self.ttl:
+            return None
+        
+        return json.loads(value)
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a response."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+        
+        if time.monotonic() >= self._next_purge:
+            self.purge_expired()
+    
+    def purge_expired(self):
+        """Delete expired responses (none expire without a TTL)."""
+        self._next_purge = time.monotonic() + _PURGE_INTERVAL
+        if not self.ttl:
+            return
+        
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._conn.commit()
+    
+    def clear(self):
+        """Delete all cached responses."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+class SemanticCache:
+    """
+    Similarity-based response cache backed by the vector store.
+    
+    Returns a cached response when a previously seen input is within
+    the configured cosine similarity threshold.
+    """
+    
+    def __init__(self, namespace: str, threshold: Optional[float] = None):
+        """
+        Initialize the cache.
+        
+        Args:
+            namespace: Cache name (one collection per namespace)
+            threshold: Minimum similarity score for a hit
+        """
+        self.collection_name = f"semantic_cache_{namespace}"
+        self.threshold = threshold if threshold is not None else settings.semantic_cache_threshold
+        self._vector_store = None
+        self._next_purge = 0.0
+    
+    @property
+    def vector_store(self):
+        """Lazy load vector store."""
+        if self._vector_store is None:
+            from rag import VectorStore
+            self._vector_store = VectorStore(collection_name=self.collection_name)
+        return self._vector_store
+    
+    def lookup(self, text: str, model: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        """
+        Look up a cached response for text.
+        
+        Returns:
+            Tuple of (cached response or None, query embedding for store())
+        """
+        try:
+            embedding = self.vector_store.embedder.embed_text(text)
+            results = self.vector_store.search(
+                text,
+                n_results=1,
+                filter_metadata={"model": model},
+                query_embedding=embedding
+            )
+        except Exception:
+            return None, None
+        
+        if results:
+            top = results[0]
+            metadata = top.get("metadata", {})
+            fresh = time.time() - metadata.get("created_at", 0) <= settings.llm_cache_ttl
+            if top.get("score", 0.0) >= self.threshold and fresh:
+                return json.loads(metadata["response"]), embedding
+        
+        return None, embedding
+    
+    def store(
+        self,
+        text: str,
+        model: str,
+        response: Dict[str, Any],
+        embedding: Optional[List[float]] = None,
+        background: bool = False
+    ):
+        """
+        Store a response for text (best effort).
+        
+        With background=True the write happens on a worker thread and this
+        returns immediately; the response is serialized before returning,
+        so the caller may go on to modify it.
+        """
+        try:
+            metadata = {
+                "model": model,
+                "response": json.dumps(response, ensure_ascii=False),
+                "created_at": time.time()
+            }
+            if background:
+                _STORE_EXECUTOR.submit(self._add, text, metadata, embedding)
+            else:
+                self._add(text, metadata, embedding)
+        except Exception:
+            pass
+    
+    def _add(self, text: str, metadata: Dict[str, Any], embedding: Optional[List[float]]):
+        """Write one entry to the vector store (best effort)."""
+        try:
+            if embedding is None:
+                embedding = self.vector_store.embedder.embed_text(text)
+            
+            # Only the embedding is needed for lookups; the stored document is
+            # a hash so users' document text isn't kept in the cache
+            self.vector_store.add_documents(
+                [hashlib.sha256(text.encode("utf-8")).hexdigest()],
+                [metadata],
+                embeddings=[embedding]
+            )
+            
+            if time.monotonic() >= self._next_purge:
+                self.purge_expired()
+        except Exception:
+            pass
+    
+    def purge_expired(self):
+        """Delete entries older than the cache TTL."""
+        self._next_purge = time.monotonic() + _PURGE_INTERVAL
+        self.vector_store.delete_where(
+            {"created_at": {"$lt": time.time() - settings.llm_cache_ttl}}
+        )
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the shared exact-match response cache."""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = ResponseCache()
+    return _RESPONSE_CACHE
@@ -4,30 +4,83 @@ FastAPI Backend for Document Helper System
 Provides REST API endpoints for document analysis.
 """
 import os
-import sys
 import shutil
+import hashlib
 import uuid
-import json
+import asyncio
+import threading
+from collections import deque
+from itertools import islice
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from functools import lru_cache
+from typing import Optional, List, Deque, Tuple
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+import orjson
 
 from config import settings
-from core import DocumentAnalysisPipeline, AnalysisResult
+
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson (much faster on Korean text)."""
+    media_type = "application/json"
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=1)
+def get_pipeline():
+    """
+    Get the analysis pipeline, building it on first use.
+    
+    Importing core pulls in the OpenAI clients, PIL and the agents, which
+    routes like /health and /history never need.
+    """
+    from core import DocumentAnalysisPipeline
+    return DocumentAnalysisPipeline()
+
+
+def warmup_pipeline():
+    """Build the pipeline and open its vector store."""
+    get_pipeline().warmup()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load the history, start the history flusher, and warm up the pipeline
+    in the background so startup isn't blocked.
+    """
+    global _history_queue
+    load_history()
+    _history_queue = asyncio.Queue()
+    flusher_task = asyncio.create_task(history_flusher(_history_queue))
+    
+    warmup_task = None
+    if settings.eager_init:
+        warmup_task = asyncio.create_task(asyncio.to_thread(warmup_pipeline))
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    
+    # Let the flusher write everything queued so far, then stop
+    queue, _history_queue = _history_queue, None
+    queue.put_nowait(_STOP_FLUSHER)
+    await flusher_task
 
 
 # Initialize FastAPI app
 app = FastAPI(
     title="문서 도우미 API (Document Helper)",
     description="디지털 취약계층을 위한 공공문서 분석 API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -39,36 +92,145 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize pipeline
-pipeline = DocumentAnalysisPipeline()
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+ALLOWED_EXTENSIONS = frozenset({'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'})
+
+# Leading bytes of each supported format, as (signature, extension);
+# WebP (RIFF....WEBP) is checked separately in sniff_file_type()
+FILE_SIGNATURES = (
+    (b'%PDF-', '.pdf'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp')
+)
+SNIFF_BYTES = 16
+
+# /analyze_batch limits; LLM calls are additionally capped process-wide
+BATCH_MAX_ITEMS = 20
+BATCH_MAX_CONCURRENCY = settings.llm_max_concurrency
 
-# In-memory history storage (in production, use a database)
-analysis_history: List[dict] = []
-HISTORY_FILE = os.path.join(settings.upload_dir, "history.json")
+# Recent history kept in memory, newest first (in production, use a database)
+HISTORY_LIMIT = 50
+analysis_history: Deque[dict] = deque(maxlen=HISTORY_LIMIT)
+
+# Append-only log, one JSON entry per line, oldest first
+HISTORY_FILE = os.path.join(settings.upload_dir, "history.jsonl")
+_history_file_lock = threading.Lock()
+
+# While the app runs, entries are queued and written by history_flusher()
+# in batches of up to HISTORY_FLUSH_BATCH, at most every HISTORY_FLUSH_INTERVAL s
+HISTORY_FLUSH_INTERVAL = 0.25
+HISTORY_FLUSH_BATCH = 32
+_history_queue: Optional[asyncio.Queue] = None
+
+# Queue markers: truncate the file (entries queued before it are dropped),
+# and stop the flusher after writing what came before
+_CLEAR_HISTORY = object()
+_STOP_FLUSHER = object()
 
 
 def load_history():
-    """Load history from file."""
+    """Load the most recent history entries from file."""
     global analysis_history
-    if os.path.exists(HISTORY_FILE):
+    if not os.path.exists(HISTORY_FILE):
+        return
+    
+    try:
+        with open(HISTORY_FILE, 'rb') as f:
+            lines = deque(f, maxlen=HISTORY_LIMIT)
+    except OSError:
+        return
+    
+    # Skip lines torn by a crash mid-write instead of losing the whole log
+    entries = []
+    for line in lines:
         try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                analysis_history = json.load(f)
-        except:
-            analysis_history = []
+            entries.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            continue
+    analysis_history = deque(reversed(entries), maxlen=HISTORY_LIMIT)
+    
+    # Compact the log so it doesn't grow without bound across restarts; this
+    # also drops any torn line, which new entries would otherwise extend
+    rewrite_history()
 
 
-def save_history():
-    """Save history to file."""
+def write_history_batch(batch: list):
+    """
+    Write queued history items to the file in one write.
+    
+    Args:
+        batch: Entries to append, possibly with _CLEAR_HISTORY markers
+    """
+    truncate = False
+    entries = []
+    for item in batch:
+        if item is _CLEAR_HISTORY:
+            truncate = True
+            entries = []
+        else:
+            entries.append(item)
+    
+    if not entries and not truncate:
+        return
+    
+    try:
+        data = b"".join(orjson.dumps(entry) + b"\n" for entry in entries)
+        with _history_file_lock:
+            with open(HISTORY_FILE, 'wb' if truncate else 'ab') as f:
+                f.write(data)
+    except Exception:
+        pass
+
+
+def persist_history(item):
+    """Queue an entry (or _CLEAR_HISTORY) for the file; writes directly if the flusher isn't running."""
+    if _history_queue is None:
+        write_history_batch([item])
+    else:
+        _history_queue.put_nowait(item)
+
+
+async def history_flusher(queue: asyncio.Queue):
+    """Drain the history queue in batches; the only file writer while the app runs."""
+    while True:
+        batch = [await queue.get()]
+        # Give a burst time to accumulate, unless a full batch is already waiting
+        if queue.qsize() < HISTORY_FLUSH_BATCH - 1:
+            await asyncio.sleep(HISTORY_FLUSH_INTERVAL)
+        while len(batch) < HISTORY_FLUSH_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
+        
+        stop = _STOP_FLUSHER in batch
+        if stop:
+            batch = batch[:batch.index(_STOP_FLUSHER)]
+        await asyncio.to_thread(write_history_batch, batch)
+        if stop:
+            return
+
+
+def rewrite_history():
+    """Rewrite the history file from the in-memory entries."""
     try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(analysis_history[-50:], f, ensure_ascii=False, indent=2)  # Keep last 50
-    except:
+        lines = [orjson.dumps(h) + b"\n" for h in reversed(analysis_history)]
+        with _history_file_lock:
+            with open(HISTORY_FILE, 'wb') as f:
+                f.writelines(lines)
+    except Exception:
         pass
 
 
-def add_to_history(result: dict, filename: str = None):
-    """Add analysis result to history."""
+def add_to_history(result: dict, filename: str = None) -> dict:
+    """
+    Add analysis result to in-memory history.
+    
+    Returns:
+        The history entry; the caller persists it with persist_history()
+    """
     history_entry = {
         "id": result.get("analysis_id", str(uuid.uuid4())),
         "timestamp": datetime.now().isoformat(),
@@ -78,12 +240,66 @@ def add_to_history(result: dict, filename: str = None):
         "risk_level": result.get("risk_level", "LOW"),
         "result": result
     }
-    analysis_history.insert(0, history_entry)  # Add to front
-    save_history()
+    analysis_history.appendleft(history_entry)  # Add to front
+    return history_entry
+
+
+# Contacts change only with the knowledge base file
+CONTACTS_MAX_AGE = 3600
+
+FALLBACK_CONTACTS = {
+    "국민연금공단": {"phone": "1355", "website": "https://www.nps.or.kr"},
+    "국민건강보험공단": {"phone": "1577-1000", "website": "https://www.nhis.or.kr"},
+    "보건복지상담센터": {"phone": "129", "website": "https://www.bokjiro.go.kr"},
+    "국세상담센터": {"phone": "126", "website": "https://www.hometax.go.kr"}
+}
+
+# Rendered /contacts body and its ETag, with the knowledge file version
+# they were rendered from
+_contacts_cache: Optional[Tuple[Optional[Tuple[int, int]], bytes, str]] = None
 
 
-# Load history on startup
-load_history()
+def render_contacts() -> Tuple[bytes, Optional[str]]:
+    """
+    Render the /contacts response and return (body, etag), reused until the knowledge file changes.
+    
+    The etag is None for the fallback body, which must not be cached.
+    """
+    global _contacts_cache
+    try:
+        from data.knowledge_base.loader import get_all_contacts, knowledge_version
+        version = knowledge_version()
+        if _contacts_cache is not None and _contacts_cache[0] == version:
+            return _contacts_cache[1:]
+        contacts = get_all_contacts()
+    except Exception:
+        # Not cached, so the next request tries the knowledge base again
+        return orjson.dumps({"status": "success", "contacts": FALLBACK_CONTACTS}), None
+    
+    body = orjson.dumps({"status": "success", "contacts": contacts})
+    _contacts_cache = (version, body, f'"{hashlib.sha1(body).hexdigest()}"')
+    return _contacts_cache[1:]
+
+
+def sniff_file_type(header: bytes) -> Optional[str]:
+    """Detect a supported file type from its first bytes; None if unknown."""
+    for signature, ext in FILE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against etag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
 
 
 class TextAnalysisRequest(BaseModel):
@@ -91,6 +307,11 @@ class TextAnalysisRequest(BaseModel):
     text: str
 
 
+class BatchAnalysisRequest(BaseModel):
+    """Request model for analyzing several texts in one call."""
+    items: List[TextAnalysisRequest]
+
+
 class FeedbackRequest(BaseModel):
     """Request model for user feedback."""
     analysis_id: str
@@ -132,25 +353,37 @@ async def analyze_document(file: UploadFile = File(...)):
     """
     try:
         # Validate file type
-        allowed_extensions = {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
         ext = os.path.splitext(file.filename)[1].lower()
         
-        if ext not in allowed_extensions:
+        if ext not in ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"지원하지 않는 파일 형식입니다: {ext}. 지원 형식: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+            )
+        
+        # Check the content too, before anything is written or sent to the model
+        header = await file.read(SNIFF_BYTES)
+        await file.seek(0)
+        sniffed_ext = sniff_file_type(header)
+        if sniffed_ext is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"지원하지 않는 파일 형식입니다: {ext}. 지원 형식: {allowed_extensions}"
+                detail="파일 내용이 지원하는 형식(PDF 또는 이미지)이 아닙니다."
             )
+        # Save under the real type, so the preprocessor opens it correctly
+        ext = sniffed_ext
         
         # Save file temporarily
         file_id = str(uuid.uuid4())
         file_path = os.path.join(settings.upload_dir, f"{file_id}{ext}")
         
+        # Copy in fixed-size chunks off the event loop
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer, UPLOAD_CHUNK_SIZE)
         
         try:
             # Analyze document
-            result = pipeline.analyze(file_path)
+            result = await get_pipeline().analyze_async(file_path)
             
             # Build response
             response_data = {
@@ -160,10 +393,11 @@ async def analyze_document(file: UploadFile = File(...)):
                 **result.to_dict()
             }
             
-            # Add to history
-            add_to_history(response_data, file.filename)
+            # Add to history; the file append is batched by the flusher
+            history_entry = add_to_history(response_data, file.filename)
+            persist_history(history_entry)
             
-            return JSONResponse(response_data)
+            return ORJSONResponse(response_data)
             
         finally:
             # Cleanup uploaded file
@@ -177,10 +411,16 @@ async def analyze_document(file: UploadFile = File(...)):
 
 
 @app.post("/analyze_text")
-async def analyze_text(request: TextAnalysisRequest):
+async def analyze_text(
+    request: TextAnalysisRequest,
+    http_request: Request
+):
     """
     Analyze document text directly (skip OCR).
     Useful when text is already extracted.
+    
+    With "Accept: text/event-stream" the result is streamed as server-sent
+    events, one per finished stage, ending with the full response.
     """
     try:
         if not request.text or len(request.text.strip()) < 10:
@@ -189,8 +429,15 @@ async def analyze_text(request: TextAnalysisRequest):
                 detail="텍스트가 너무 짧습니다. 최소 10자 이상 입력해주세요."
             )
         
+        if "text/event-stream" in http_request.headers.get("accept", ""):
+            return StreamingResponse(
+                stream_text_analysis(request.text),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"}
+            )
+        
         # Analyze text
-        result = pipeline.analyze_text(request.text)
+        result = await get_pipeline().analyze_text_async(request.text)
         
         response_data = {
             "status": "success",
@@ -198,10 +445,11 @@ async def analyze_text(request: TextAnalysisRequest):
             **result.to_dict()
         }
         
-        # Add to history
-        add_to_history(response_data)
+        # Add to history; the file append is batched by the flusher
+        history_entry = add_to_history(response_data)
+        persist_history(history_entry)
         
-        return JSONResponse(response_data)
+        return ORJSONResponse(response_data)
         
     except HTTPException:
         raise
@@ -209,6 +457,69 @@ async def analyze_text(request: TextAnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/analyze_batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Analyze several document texts in one request.
+    
+    Items are analyzed concurrently; results are in the same order as items.
+    """
+    if not request.items or len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"한 번에 1개에서 {BATCH_MAX_ITEMS}개까지 분석할 수 있습니다."
+        )
+    for i, item in enumerate(request.items):
+        if not item.text or len(item.text.strip()) < 10:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{i + 1}번째 텍스트가 너무 짧습니다. 최소 10자 이상 입력해주세요."
+            )
+    
+    pipeline = get_pipeline()
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def analyze_one(text: str) -> dict:
+        async with semaphore:
+            result = await pipeline.analyze_text_async(text)
+        
+        response_data = {
+            "status": "success",
+            "analysis_id": str(uuid.uuid4()),
+            **result.to_dict()
+        }
+        persist_history(add_to_history(response_data))
+        return response_data
+    
+    try:
+        results = await asyncio.gather(*(analyze_one(item.text) for item in request.items))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return ORJSONResponse({
+        "status": "success",
+        "count": len(results),
+        "results": results
+    })
+
+
+async def stream_text_analysis(text: str):
+    """Yield text analysis events as SSE messages; the last one is the full response."""
+    analysis_id = str(uuid.uuid4())
+    async for event in get_pipeline().analyze_text_stream(text):
+        if event["stage"] == "result":
+            response_data = {
+                "status": "success",
+                "analysis_id": analysis_id,
+                **event["result"]
+            }
+            event = {"stage": "result", "result": response_data}
+            history_entry = add_to_history(response_data)
+            persist_history(history_entry)
+        
+        yield b"data: " + orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
 @app.post("/feedback")
 async def submit_feedback(request: FeedbackRequest):
     """
@@ -222,11 +533,19 @@ async def submit_feedback(request: FeedbackRequest):
 
 
 @app.get("/history")
-async def get_history(limit: int = 10):
+async def get_history(request: Request, limit: int = Query(10, ge=0, le=HISTORY_LIMIT)):
     """Get recent analysis history."""
-    return {
+    # Every new entry has a new id, so the newest id identifies the state
+    newest_id = analysis_history[0]["id"] if analysis_history else ""
+    etag = f'W/"{limit}-{len(analysis_history)}-{newest_id}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    recent = list(islice(analysis_history, limit))
+    return ORJSONResponse({
         "status": "success",
-        "count": len(analysis_history[:limit]),
+        "count": len(recent),
         "history": [
             {
                 "id": h["id"],
@@ -236,9 +555,9 @@ async def get_history(limit: int = 10):
                 "summary_one_line": h["summary_one_line"],
                 "risk_level": h["risk_level"]
             }
-            for h in analysis_history[:limit]
+            for h in recent
         ]
-    }
+    }, headers=headers)
 
 
 @app.get("/history/{analysis_id}")
@@ -256,33 +575,23 @@ async def get_history_detail(analysis_id: str):
 @app.delete("/history")
 async def clear_history():
     """Clear all history."""
-    global analysis_history
-    analysis_history = []
-    save_history()
+    analysis_history.clear()
+    persist_history(_CLEAR_HISTORY)
     return {"status": "success", "message": "기록이 삭제되었습니다."}
 
 
 @app.get("/contacts")
-async def get_contacts():
+async def get_contacts(request: Request):
     """Get all contact information for public services."""
-    try:
-        from data.knowledge_base.loader import get_all_contacts
-        contacts = get_all_contacts()
-        return {
-            "status": "success",
-            "contacts": contacts
-        }
-    except Exception as e:
-        # Fallback contacts
-        return {
-            "status": "success",
-            "contacts": {
-                "국민연금공단": {"phone": "1355", "website": "https://www.nps.or.kr"},
-                "국민건강보험공단": {"phone": "1577-1000", "website": "https://www.nhis.or.kr"},
-                "보건복지상담센터": {"phone": "129", "website": "https://www.bokjiro.go.kr"},
-                "국세상담센터": {"phone": "126", "website": "https://www.hometax.go.kr"}
-            }
-        }
+    body, etag = render_contacts()
+    if etag is None:
+        # Fallback contacts: clients must retry instead of keeping them
+        return Response(body, media_type="application/json", headers={"Cache-Control": "no-store"})
+    
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CONTACTS_MAX_AGE}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.get("/knowledge/stats")
@@ -303,6 +612,7 @@ async def reload_knowledge_base():
     try:
         from data.knowledge_base.loader import load_knowledge_base
         count = load_knowledge_base()
+        get_pipeline().rag_agent.clear_cache()
         return {
             "status": "success",
             "items_loaded": count
@@ -311,7 +621,8 @@ async def reload_knowledge_base():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Run with: uvicorn api.main:app --reload --port 8001
+# Run from the repo root with: uvicorn api.main:app --reload --port 8001
+# (or python -m api.main)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
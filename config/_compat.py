@@ -0,0 +1,10 @@
+"""
+Python version compatibility helpers shared by the agents and core modules.
+"""
+import sys
+
+
+# Keyword arguments for @dataclass: per-page, per-request and per-result
+# dataclasses drop their __dict__ where the interpreter supports it
+# (slots=True is Python 3.10+)
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
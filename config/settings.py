@@ -2,6 +2,7 @@
 Configuration settings for the Document Helper System.
 """
 import os
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from typing import Optional
@@ -14,21 +15,41 @@ class Settings(BaseSettings):
     openai_api_key: str = Field(default="", env="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-4o-mini", env="OPENAI_MODEL")
     embedding_model: str = Field(default="text-embedding-3-small", env="EMBEDDING_MODEL")
+    # Shorter text-embedding-3 vectors (e.g. 512); None keeps the model's
+    # full size. Changing it requires rebuilding the vector database
+    embedding_dimensions: Optional[int] = Field(default=None, env="EMBEDDING_DIMENSIONS")
+    
+    # Maximum concurrent in-flight LLM requests (stays inside rate limits)
+    llm_max_concurrency: int = Field(default=8, env="LLM_MAX_CONCURRENCY")
+    
+    # Build the analysis pipeline at API startup instead of on first use
+    eager_init: bool = Field(default=True, env="EAGER_INIT")
     
     # Paths
     base_dir: str = Field(default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     upload_dir: str = Field(default="")
     vectordb_dir: str = Field(default="")
     knowledge_dir: str = Field(default="")
+    cache_dir: str = Field(default="")
     
     # RAG settings
     chunk_size: int = Field(default=500, env="CHUNK_SIZE")
     chunk_overlap: int = Field(default=100, env="CHUNK_OVERLAP")
     top_k_retrieval: int = Field(default=5, env="TOP_K_RETRIEVAL")
     
+    # LLM response cache settings
+    llm_cache_enabled: bool = Field(default=True, env="LLM_CACHE_ENABLED")
+    llm_cache_ttl: int = Field(default=86400, env="LLM_CACHE_TTL")
+    semantic_cache_enabled: bool = Field(default=True, env="SEMANTIC_CACHE_ENABLED")
+    semantic_cache_threshold: float = Field(default=0.95, env="SEMANTIC_CACHE_THRESHOLD")
+    rag_cache_size: int = Field(default=4096, env="RAG_CACHE_SIZE")
+    rag_cache_ttl: int = Field(default=3600, env="RAG_CACHE_TTL")
+    
     # OCR settings
     tesseract_cmd: Optional[str] = Field(default=None, env="TESSERACT_CMD")
     ocr_lang: str = Field(default="kor+eng", env="OCR_LANG")
+    # Below this average page confidence (0-100) the LLM stages are skipped
+    min_ocr_confidence: float = Field(default=40.0, env="MIN_OCR_CONFIDENCE")
     
     class Config:
         env_file = ".env"
@@ -43,12 +64,20 @@ class Settings(BaseSettings):
             self.vectordb_dir = os.path.join(self.base_dir, "data", "vectordb")
         if not self.knowledge_dir:
             self.knowledge_dir = os.path.join(self.base_dir, "data", "knowledge_base")
+        if not self.cache_dir:
+            self.cache_dir = os.path.join(self.base_dir, "data", "cache")
         
         # Create directories if they don't exist
-        os.makedirs(self.upload_dir, exist_ok=True)
-        os.makedirs(self.vectordb_dir, exist_ok=True)
-        os.makedirs(self.knowledge_dir, exist_ok=True)
+        for path in (self.upload_dir, self.vectordb_dir, self.knowledge_dir, self.cache_dir):
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the process-wide settings, reading the environment only once."""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
@@ -4,18 +4,48 @@ Vision OCR Engine using GPT-4 Vision
 Extracts text from images using OpenAI's GPT-4 Vision model.
 No external dependencies required (no Tesseract).
 """
-import os
+import asyncio
 import base64
-from typing import Optional
+from typing import List, Optional
 from dataclasses import dataclass, field
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from openai import OpenAI
 from config import settings
+from agents.base_agent import BaseAgent, LoopSemaphore
+from agents.response_cache import get_response_cache, make_cache_key
+
+
+# Limits concurrent in-flight Vision requests (e.g. pages of one PDF)
+_OCR_SEMAPHORE = LoopSemaphore(settings.llm_max_concurrency)
+
+# At detail=high the model fits images into 2048x2048, so larger uploads
+# only cost bandwidth and base64 time
+_VISION_MAX_DIMENSION = 2048
+_JPEG_QUALITY = 85
+
+_JPEG_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+# EXIF tag holding the camera rotation
+_EXIF_ORIENTATION = 0x0112
+
+_OCR_SYSTEM_PROMPT = """당신은 한국 공공문서 OCR 전문가입니다.
+이미지에서 모든 텍스트를 정확하게 추출해주세요.
+
+규칙:
+1. 이미지에 보이는 모든 텍스트를 그대로 추출
+2. 줄바꿈과 구조를 최대한 유지
+3. 표가 있으면 텍스트로 변환
+4. 숫자, 날짜, 금액은 정확하게
+5. 한글과 영어 모두 인식"""
+
+_OCR_USER_TEXT = "이 공공문서 이미지에서 모든 텍스트를 추출해주세요."
+
+_OCR_MAX_TOKENS = 4000
+
+# Static message parts shared by every request
+_OCR_SYSTEM_MESSAGE = {"role": "system", "content": _OCR_SYSTEM_PROMPT}
+_OCR_USER_TEXT_PART = {"type": "text", "text": _OCR_USER_TEXT}
 
 
 @dataclass
@@ -42,7 +72,9 @@ class VisionOCREngine:
     """
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        # Same clients (and connection pool) as the agents
+        self.client = BaseAgent.get_client()
+        self.async_client = BaseAgent.get_async_client()
         self.model = "gpt-4o-mini"  # Supports vision
     
     def extract_text(self, image_path: str) -> OCRResult:
@@ -56,59 +88,10 @@ class VisionOCREngine:
             OCRResult with extracted text
         """
         try:
-            # Read and encode image
-            base64_image = self._encode_image(image_path)
-            
-            # Call GPT-4 Vision
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """당신은 한국 공공문서 OCR 전문가입니다.
-이미지에서 모든 텍스트를 정확하게 추출해주세요.
-
-규칙:
-1. 이미지에 보이는 모든 텍스트를 그대로 추출
-2. 줄바꿈과 구조를 최대한 유지
-3. 표가 있으면 텍스트로 변환
-4. 숫자, 날짜, 금액은 정확하게
-5. 한글과 영어 모두 인식"""
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "이 공공문서 이미지에서 모든 텍스트를 추출해주세요."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=4000
-            )
-            
-            extracted_text = response.choices[0].message.content
-            
-            return OCRResult(
-                text=extracted_text,
-                confidence=95.0,  # GPT-4V is generally very accurate
-                language="kor"
-            )
-            
+            image_url = self._encode_image(image_path)
         except Exception as e:
-            return OCRResult(
-                text=f"OCR 오류: {str(e)}",
-                confidence=0.0,
-                language="kor"
-            )
+            return self._error_result(e)
+        return self._call_vision(image_url)
     
     def extract_from_pil_image(self, image: Image.Image) -> OCRResult:
         """
@@ -121,71 +104,185 @@ class VisionOCREngine:
             OCRResult with extracted text
         """
         try:
-            # Convert PIL Image to base64
-            buffer = io.BytesIO()
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            image.save(buffer, format='JPEG', quality=95)
-            base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            # Call GPT-4 Vision
+            image_url = self._encode_pil_image(image)
+        except Exception as e:
+            return self._error_result(e)
+        return self._call_vision(image_url)
+    
+    async def extract_text_async(self, image_path: str) -> OCRResult:
+        """Async variant of extract_text()."""
+        try:
+            image_url = await asyncio.to_thread(self._encode_image, image_path)
+        except Exception as e:
+            return self._error_result(e)
+        return await self._acall_vision(image_url)
+    
+    async def extract_from_pil_image_async(self, image: Image.Image) -> OCRResult:
+        """Async variant of extract_from_pil_image()."""
+        try:
+            image_url = await asyncio.to_thread(self._encode_pil_image, image)
+        except Exception as e:
+            return self._error_result(e)
+        return await self._acall_vision(image_url)
+    
+    async def extract_many(self, images: List[Image.Image]) -> List[OCRResult]:
+        """
+        Extract text from several images (e.g. PDF pages) concurrently.
+        
+        Args:
+            images: PIL Images
+        
+        Returns:
+            OCRResults in the same order as images
+        """
+        return list(await asyncio.gather(
+            *(self.extract_from_pil_image_async(image) for image in images)
+        ))
+    
+    def _call_vision(self, image_url: str) -> OCRResult:
+        """Send one JPEG data URL to the Vision model."""
+        cache_key = self._cache_key(image_url)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """당신은 한국 공공문서 OCR 전문가입니다.
-이미지에서 모든 텍스트를 정확하게 추출해주세요.
-
-규칙:
-1. 이미지에 보이는 모든 텍스트를 그대로 추출
-2. 줄바꿈과 구조를 최대한 유지
-3. 표가 있으면 텍스트로 변환
-4. 숫자, 날짜, 금액은 정확하게
-5. 한글과 영어 모두 인식"""
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "이 공공문서 이미지에서 모든 텍스트를 추출해주세요."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=4000
-            )
-            
-            extracted_text = response.choices[0].message.content
-            
-            return OCRResult(
-                text=extracted_text,
-                confidence=95.0,
-                language="kor"
+                messages=self._build_messages(image_url),
+                max_tokens=_OCR_MAX_TOKENS
             )
-            
         except Exception as e:
-            return OCRResult(
-                text=f"OCR 오류: {str(e)}",
-                confidence=0.0,
-                language="kor"
-            )
+            return self._error_result(e)
+        
+        result = self._text_result(response.choices[0].message.content)
+        self._cache_set(cache_key, result)
+        return result
+    
+    async def _acall_vision(self, image_url: str) -> OCRResult:
+        """Async variant of _call_vision()."""
+        cache_key = self._cache_key(image_url)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            async with _OCR_SEMAPHORE:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=self._build_messages(image_url),
+                    max_tokens=_OCR_MAX_TOKENS
+                )
+        except Exception as e:
+            return self._error_result(e)
+        
+        result = self._text_result(response.choices[0].message.content)
+        self._cache_set(cache_key, result)
+        return result
+    
+    def _cache_key(self, image_url: str) -> str:
+        """
+        Cache key for one OCR request.
+        
+        Exact match on the encoded image data: near-duplicate matching would hand
+        one bill's amounts and dates to another bill from the same template.
+        """
+        return make_cache_key(
+            type(self).__name__,
+            self.model,
+            _OCR_SYSTEM_PROMPT,
+            _OCR_USER_TEXT,
+            image_url
+        )
+    
+    def _cache_get(self, key: str) -> Optional[OCRResult]:
+        """Look up a cached OCR result."""
+        if not settings.llm_cache_enabled:
+            return None
+        cached = get_response_cache().get(key)
+        return OCRResult(**cached) if cached is not None else None
+    
+    def _cache_set(self, key: str, result: OCRResult):
+        """Cache a successful OCR result."""
+        if settings.llm_cache_enabled and result.text:
+            get_response_cache().set(key, result.to_dict())
+    
+    @staticmethod
+    def _build_messages(image_url: str) -> List[dict]:
+        """Build the Vision request; only the image part is built per call."""
+        return [
+            _OCR_SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": [
+                    _OCR_USER_TEXT_PART,
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "high"
+                        }
+                    }
+                ]
+            }
+        ]
+    
+    @staticmethod
+    def _text_result(text: str) -> OCRResult:
+        """Wrap a successful Vision response."""
+        return OCRResult(
+            text=text,
+            confidence=95.0,  # GPT-4V is generally very accurate
+            language="kor"
+        )
+    
+    @staticmethod
+    def _error_result(error: Exception) -> OCRResult:
+        """Report a failure as OCR text, as callers expect."""
+        return OCRResult(
+            text=f"OCR 오류: {str(error)}",
+            confidence=0.0,
+            language="kor"
+        )
+    
+    def _encode_pil_image(self, image: Image.Image) -> str:
+        """Downscale PIL Image to the Vision input size and encode as a JPEG data URL."""
+        buffer = io.BytesIO()
+        
+        # Convert to RGB if necessary
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        if max(image.size) > _VISION_MAX_DIMENSION:
+            scale = _VISION_MAX_DIMENSION / max(image.size)
+            new_size = (int(image.size[0] * scale), int(image.size[1] * scale))
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
+        
+        image.save(buffer, format='JPEG', quality=_JPEG_QUALITY, optimize=True)
+        return self._data_url(buffer.getvalue())
     
     def _encode_image(self, image_path: str) -> str:
-        """Encode image file to base64."""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        """Encode image file as a JPEG data URL."""
+        with Image.open(image_path) as image:
+            # A JPEG that is already small and upright is sent as is,
+            # skipping a decode and re-encode
+            upright = image.getexif().get(_EXIF_ORIENTATION, 1) == 1
+            if (
+                image.format == 'JPEG'
+                and image.mode in ('RGB', 'L')
+                and max(image.size) <= _VISION_MAX_DIMENSION
+                and upright
+            ):
+                with open(image_path, 'rb') as f:
+                    return self._data_url(f.read())
+            
+            # Re-encoding drops EXIF, so apply its rotation first
+            return self._encode_pil_image(ImageOps.exif_transpose(image))
+    
+    @staticmethod
+    def _data_url(jpeg_bytes: bytes) -> str:
+        """Inline JPEG bytes as a data URL for the image_url message part."""
+        return _JPEG_DATA_URL_PREFIX + base64.b64encode(jpeg_bytes).decode('ascii')
 
 
 # Convenience function
@@ -3,27 +3,49 @@ Document Analysis Pipeline
 
 Orchestrates the entire document analysis workflow.
 """
-import os
 import time
-from typing import Dict, Any, Optional, List
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator, Iterable, Iterator
 from dataclasses import dataclass, field
-
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functools import cached_property
 
 from config import settings
+from config._compat import DATACLASS_SLOTS
 from core.preprocessor import DocumentPreprocessor, PreprocessedImage
 from core.ocr_engine import OCREngine, OCRResult
 from agents import (
     DocumentClassifier,
     InfoExtractor,
+    CombinedAnalyzer,
     RAGAgent,
     ActionPlanner,
     Simplifier
 )
+from agents.response_cache import get_response_cache, make_cache_key
+from data.knowledge_base.loader import knowledge_version
+
+
+# Bump when a stage's post-processing changes in a way the agents'
+# prompt versions don't capture, so stored results are rebuilt
+_RESULT_CACHE_VERSION = "1"
 
+# Stage names of the streams merged in analyze_text_stream(), by index
+_STREAM_STAGES = ("action_plan", "simplified")
 
-@dataclass
+# Queued by _interleave() when one of its streams ends
+_STREAM_DONE = object()
+
+# AnalysisResult fields produced by stages 3-7, i.e. what the result cache stores
+_AGENT_RESULT_FIELDS = (
+    "doc_type", "doc_type_name", "organization", "risk_level", "action_required",
+    "key_info", "summary_one_line", "what_is_this", "key_points", "steps_easy",
+    "dont_worry", "need_help_message", "action_plan", "evidence_chunks"
+)
+
+
+@dataclass(**DATACLASS_SLOTS)
 class AnalysisResult:
     """Complete document analysis result."""
     # Document info
@@ -77,6 +99,36 @@ class AnalysisResult:
         }
 
 
+async def _interleave(*streams: AsyncIterator[Any]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (stream index, item) from several async iterators as items arrive."""
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def pump(index: int, stream: AsyncIterator[Any]):
+        try:
+            async for item in stream:
+                await queue.put((index, item, None))
+            await queue.put((index, _STREAM_DONE, None))
+        except Exception as e:
+            await queue.put((index, _STREAM_DONE, e))
+    
+    tasks = [asyncio.create_task(pump(i, stream)) for i, stream in enumerate(streams)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            index, item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is _STREAM_DONE:
+                remaining -= 1
+                continue
+            yield index, item
+    finally:
+        # Only still running if we stopped early (error or closed consumer)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 class DocumentAnalysisPipeline:
     """
     Orchestrates the complete document analysis pipeline.
@@ -85,22 +137,40 @@ class DocumentAnalysisPipeline:
     1. Preprocessing (image/PDF handling)
     2. OCR (text extraction)
     3. Document Classification
-    4. Information Extraction
+    4. Information Extraction (fused with 3 into one LLM call)
     5. RAG Context Retrieval
     6. Action Planning
     7. Simplification
     """
     
     def __init__(self):
-        """Initialize all pipeline components."""
-        self.preprocessor = DocumentPreprocessor()
-        self.ocr_engine = OCREngine()
+        """Initialize the agents; file-input components are built on first use."""
         self.classifier = DocumentClassifier()
         self.extractor = InfoExtractor()
+        self.analyzer = CombinedAnalyzer(self.classifier, self.extractor)
         self.rag_agent = RAGAgent()
         self.planner = ActionPlanner()
         self.simplifier = Simplifier()
     
+    # Only analyze()/analyze_async() need these, so text-only callers
+    # (analyze_text, /analyze_batch) never build them. Construction is
+    # idempotent, so a rare double build from racing threads is harmless.
+    @cached_property
+    def preprocessor(self) -> DocumentPreprocessor:
+        return DocumentPreprocessor()
+    
+    @cached_property
+    def ocr_engine(self) -> OCREngine:
+        return OCREngine()
+    
+    def warmup(self):
+        """
+        Initialize slow components (vector store) before the first request.
+        
+        Blocking; callers should run it in a background thread.
+        """
+        self.rag_agent.warmup()
+    
     def analyze(self, file_path: str) -> AnalysisResult:
         """
         Analyze a document file.
@@ -115,86 +185,95 @@ class DocumentAnalysisPipeline:
         result = AnalysisResult()
         
         try:
-            # Stage 1: Preprocess
-            preprocessed_images = self.preprocessor.preprocess_file(file_path)
-            
-            # Stage 2: OCR
-            ocr_results = []
-            for img_data in preprocessed_images:
-                ocr_result = self.ocr_engine.extract_from_pil_image(img_data.image)
-                ocr_results.append(ocr_result)
+            # Stage 1 + 2: Preprocess and OCR, pipelined: each page goes to
+            # OCR as soon as it is rendered (the OCR calls are network-bound)
+            ocr_results = self._ocr_pages(self.preprocessor.iter_pages(file_path))
             
-            # Combine OCR text from all pages
-            full_text = "\n\n".join([r.text for r in ocr_results])
-            avg_confidence = sum([r.confidence for r in ocr_results]) / len(ocr_results) if ocr_results else 0
+            full_text = self._combine_ocr_results(result, ocr_results)
             
-            result.ocr_confidence = avg_confidence
-            
-            if not full_text.strip():
-                result.summary_one_line = "문서를 읽을 수 없습니다."
-                result.what_is_this = "이미지 품질이 좋지 않아 글자를 인식하지 못했습니다."
-                result.steps_easy = ["더 선명한 사진을 다시 찍어주세요."]
+            # Don't spend the LLM stages on text the OCR couldn't read
+            if not full_text.strip() or result.ocr_confidence < settings.min_ocr_confidence:
+                self._set_unreadable(result)
                 return result
             
-            # Stage 3: Document Classification
-            classification = self.classifier.process(ocr_text=full_text)
-            result.doc_type = classification.get("doc_type", "기타_공공문서")
-            result.doc_type_name = classification.get("doc_type_name", "기타 공공문서")
-            result.organization = classification.get("organization", "")
+            self._run_agents(result, full_text)
             
-            # Stage 4: Information Extraction
-            key_info = self.extractor.process(
-                ocr_text=full_text,
-                doc_type=result.doc_type
-            )
-            result.key_info = key_info
-            result.action_required = key_info.get("action_required", False)
-            
-            # Determine risk level
-            penalty_risk = key_info.get("penalty_risk", "NONE")
-            if penalty_risk == "HIGH":
-                result.risk_level = "HIGH"
-            elif penalty_risk == "MEDIUM":
-                result.risk_level = "MEDIUM"
-            else:
-                result.risk_level = "LOW"
-            
-            # Stage 5: RAG Context Retrieval
-            rag_result = self.rag_agent.process(
-                doc_type=result.doc_type,
-                key_info=key_info,
-                ocr_text=full_text
-            )
-            result.evidence_chunks = rag_result.get("retrieved_chunks", [])
+        except Exception as e:
+            self._set_error(result, e)
+        
+        finally:
+            elapsed = (time.time() - start_time) * 1000
+            result.processing_time_ms = int(elapsed)
+        
+        return result
+    
+    def _ocr_pages(self, pages: Iterable[PreprocessedImage]) -> List[OCRResult]:
+        """
+        OCR pages on a thread pool as they are produced, keeping page order.
+        
+        At most llm_max_concurrency pages wait for or run OCR at a time, so
+        a long PDF is never held in memory all at once.
+        """
+        slots = threading.BoundedSemaphore(settings.llm_max_concurrency)
+        
+        def ocr(image):
+            try:
+                return self.ocr_engine.extract_from_pil_image(image)
+            finally:
+                slots.release()
+        
+        futures = []
+        with ThreadPoolExecutor(max_workers=settings.llm_max_concurrency) as executor:
+            for page in pages:
+                slots.acquire()
+                futures.append(executor.submit(ocr, page.image))
+        return [future.result() for future in futures]
+    
+    async def _ocr_pages_async(self, pages: Iterator[PreprocessedImage]) -> List[OCRResult]:
+        """Async variant of _ocr_pages(); OCR calls are bounded by the OCR engine."""
+        loop = asyncio.get_running_loop()
+        tasks = []
+        # Rendering is CPU-bound and PyMuPDF is not thread-safe, so pages
+        # are pulled on one dedicated thread, off the event loop
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            try:
+                while True:
+                    page = await loop.run_in_executor(executor, next, pages, None)
+                    if page is None:
+                        break
+                    tasks.append(asyncio.create_task(
+                        self.ocr_engine.extract_from_pil_image_async(page.image)
+                    ))
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+        return list(await asyncio.gather(*tasks))
+    
+    async def analyze_async(self, file_path: str) -> AnalysisResult:
+        """
+        Async variant of analyze().
+        
+        Independent LLM stages run concurrently on the event loop.
+        """
+        start_time = time.time()
+        result = AnalysisResult()
+        
+        try:
+            # Stage 1 + 2: Preprocess and OCR, pipelined as in analyze()
+            ocr_results = await self._ocr_pages_async(self.preprocessor.iter_pages(file_path))
             
-            # Stage 6: Action Planning
-            action_plan = self.planner.process(
-                doc_type=result.doc_type,
-                key_info=key_info,
-                rag_context=rag_result
-            )
-            result.action_plan = action_plan
+            full_text = self._combine_ocr_results(result, ocr_results)
             
-            # Stage 7: Simplification
-            simplified = self.simplifier.process(
-                doc_type=result.doc_type_name,
-                key_info=key_info,
-                action_plan=action_plan,
-                rag_context=rag_result
-            )
+            # Don't spend the LLM stages on text the OCR couldn't read
+            if not full_text.strip() or result.ocr_confidence < settings.min_ocr_confidence:
+                self._set_unreadable(result)
+                return result
             
-            result.summary_one_line = simplified.get("summary_one_line", "")
-            result.what_is_this = simplified.get("what_is_this", "")
-            result.key_points = simplified.get("key_points", [])
-            result.steps_easy = simplified.get("steps_easy", [])
-            result.risk_level = simplified.get("risk_level", result.risk_level)
-            result.dont_worry = simplified.get("dont_worry", "")
-            result.need_help_message = simplified.get("need_help_message", "")
+            await self._run_agents_async(result, full_text)
             
         except Exception as e:
-            result.summary_one_line = "문서 분석 중 오류가 발생했습니다."
-            result.what_is_this = f"오류: {str(e)}"
-            result.steps_easy = ["다시 시도해주세요."]
+            self._set_error(result, e)
         
         finally:
             elapsed = (time.time() - start_time) * 1000
@@ -218,66 +297,283 @@ class DocumentAnalysisPipeline:
         
         try:
             # Skip to Stage 3: Classification
-            classification = self.classifier.process(ocr_text=text)
-            result.doc_type = classification.get("doc_type", "기타_공공문서")
-            result.doc_type_name = classification.get("doc_type_name", "기타 공공문서")
-            result.organization = classification.get("organization", "")
+            self._run_agents(result, text)
             
-            # Stage 4: Information Extraction
-            key_info = self.extractor.process(
-                ocr_text=text,
-                doc_type=result.doc_type
-            )
-            result.key_info = key_info
-            result.action_required = key_info.get("action_required", False)
+        except Exception as e:
+            self._set_error(result, e)
+        
+        finally:
+            elapsed = (time.time() - start_time) * 1000
+            result.processing_time_ms = int(elapsed)
+        
+        return result
+    
+    async def analyze_text_async(self, text: str) -> AnalysisResult:
+        """Async variant of analyze_text()."""
+        start_time = time.time()
+        result = AnalysisResult()
+        result.ocr_confidence = 100.0  # Perfect since text is provided
+        
+        try:
+            await self._run_agents_async(result, text)
             
-            penalty_risk = key_info.get("penalty_risk", "NONE")
-            if penalty_risk == "HIGH":
-                result.risk_level = "HIGH"
-            elif penalty_risk == "MEDIUM":
-                result.risk_level = "MEDIUM"
-            else:
-                result.risk_level = "LOW"
+        except Exception as e:
+            self._set_error(result, e)
+        
+        finally:
+            elapsed = (time.time() - start_time) * 1000
+            result.processing_time_ms = int(elapsed)
+        
+        return result
+    
+    async def analyze_text_stream(self, text: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of analyze_text_async().
+        
+        Yields events as stages finish so clients can render progressively:
+            {"stage": "analysis", ...} once classification/extraction is done
+            {"stage": "action_plan", "field": ..., "value": ...} per plan part
+            {"stage": "simplified", "field": ..., "value": ...} per explanation field
+              (plan and explanation are generated concurrently, so these interleave)
+            {"stage": "result", "result": <AnalysisResult.to_dict()>} last
+        """
+        start_time = time.time()
+        result = AnalysisResult()
+        result.ocr_confidence = 100.0  # Perfect since text is provided
+        
+        try:
+            # Stage 3 + 4: Classification and Information Extraction (one LLM call)
+            combined = await self.analyzer.process_async(ocr_text=text)
+            self._apply_classification(result, combined["classification"])
+            key_info = combined["key_info"]
+            self._apply_key_info(result, key_info)
+            yield {
+                "stage": "analysis",
+                "doc_type": result.doc_type,
+                "doc_type_name": result.doc_type_name,
+                "organization": result.organization,
+                "risk_level": result.risk_level,
+                "action_required": result.action_required,
+                "key_info": key_info
+            }
             
-            # Stage 5: RAG
-            rag_result = self.rag_agent.process(
+            # Stage 5: RAG Context Retrieval
+            rag_result = await self.rag_agent.process_async(
                 doc_type=result.doc_type,
                 key_info=key_info,
                 ocr_text=text
             )
             result.evidence_chunks = rag_result.get("retrieved_chunks", [])
             
-            # Stage 6: Action Planning
-            action_plan = self.planner.process(
+            # Stage 6 + 7: Action Planning and Simplification concurrently,
+            # forwarding each one's events as they arrive
+            outline = self.planner.plan_outline(result.doc_type, key_info)
+            streams = (
+                self.planner.stream_plan(
+                    doc_type=result.doc_type,
+                    key_info=key_info,
+                    rag_context=rag_result
+                ),
+                self.simplifier.stream_process(
+                    doc_type=result.doc_type_name,
+                    key_info=key_info,
+                    action_plan=outline,
+                    rag_context=rag_result
+                )
+            )
+            async for index, event in _interleave(*streams):
+                if event.pop("partial"):
+                    yield {"stage": _STREAM_STAGES[index], **event}
+                elif index == 0:
+                    result.action_plan = event["result"]
+                else:
+                    self._apply_simplified(result, event["result"])
+            
+        except Exception as e:
+            self._set_error(result, e)
+        
+        elapsed = (time.time() - start_time) * 1000
+        result.processing_time_ms = int(elapsed)
+        yield {"stage": "result", "result": result.to_dict()}
+    
+    def _run_agents(self, result: AnalysisResult, text: str):
+        """Run stages 3-7 (classification through simplification)."""
+        cache_key = self._result_cache_key(text)
+        if self._result_cache_get(result, cache_key):
+            return
+        
+        # Stage 3 + 4: Classification and Information Extraction (one LLM call)
+        combined = self.analyzer.process(ocr_text=text)
+        self._apply_classification(result, combined["classification"])
+        key_info = combined["key_info"]
+        self._apply_key_info(result, key_info)
+        
+        # Stage 5: RAG Context Retrieval
+        rag_result = self.rag_agent.process(
+            doc_type=result.doc_type,
+            key_info=key_info,
+            ocr_text=text
+        )
+        result.evidence_chunks = rag_result.get("retrieved_chunks", [])
+        
+        # Stage 6 + 7: Action Planning and Simplification side by side; the
+        # simplifier only needs the rule-based outline of the plan
+        outline = self.planner.plan_outline(result.doc_type, key_info)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            plan_future = executor.submit(
+                self.planner.process,
                 doc_type=result.doc_type,
                 key_info=key_info,
                 rag_context=rag_result
             )
-            result.action_plan = action_plan
-            
-            # Stage 7: Simplification
             simplified = self.simplifier.process(
                 doc_type=result.doc_type_name,
                 key_info=key_info,
-                action_plan=action_plan,
+                action_plan=outline,
                 rag_context=rag_result
             )
-            
-            result.summary_one_line = simplified.get("summary_one_line", "")
-            result.what_is_this = simplified.get("what_is_this", "")
-            result.key_points = simplified.get("key_points", [])
-            result.steps_easy = simplified.get("steps_easy", [])
-            result.risk_level = simplified.get("risk_level", result.risk_level)
-            result.dont_worry = simplified.get("dont_worry", "")
-            result.need_help_message = simplified.get("need_help_message", "")
-            
-        except Exception as e:
-            result.summary_one_line = "문서 분석 중 오류가 발생했습니다."
-            result.what_is_this = f"오류: {str(e)}"
-            result.steps_easy = ["다시 시도해주세요."]
+            action_plan = plan_future.result()
+        result.action_plan = action_plan
+        self._apply_simplified(result, simplified)
         
-        finally:
-            elapsed = (time.time() - start_time) * 1000
-            result.processing_time_ms = int(elapsed)
+        # Don't keep a degraded result (e.g. LLM call failed, vector store
+        # unavailable)
+        parts = (combined["classification"], key_info, rag_result, action_plan, simplified)
+        if not any("error" in part for part in parts):
+            self._result_cache_set(result, cache_key)
+    
+    async def _run_agents_async(self, result: AnalysisResult, text: str):
+        """Async variant of _run_agents()."""
+        cache_key = self._result_cache_key(text)
+        if await asyncio.to_thread(self._result_cache_get, result, cache_key):
+            return
         
-        return result
+        # Stage 3 + 4: Classification and Information Extraction (one LLM call)
+        combined = await self.analyzer.process_async(ocr_text=text)
+        self._apply_classification(result, combined["classification"])
+        key_info = combined["key_info"]
+        self._apply_key_info(result, key_info)
+        
+        # Stage 5: RAG Context Retrieval
+        rag_result = await self.rag_agent.process_async(
+            doc_type=result.doc_type,
+            key_info=key_info,
+            ocr_text=text
+        )
+        result.evidence_chunks = rag_result.get("retrieved_chunks", [])
+        
+        # Stage 6 + 7: Action Planning and Simplification concurrently
+        outline = self.planner.plan_outline(result.doc_type, key_info)
+        action_plan, simplified = await asyncio.gather(
+            self.planner.process_async(
+                doc_type=result.doc_type,
+                key_info=key_info,
+                rag_context=rag_result
+            ),
+            self.simplifier.process_async(
+                doc_type=result.doc_type_name,
+                key_info=key_info,
+                action_plan=outline,
+                rag_context=rag_result
+            )
+        )
+        result.action_plan = action_plan
+        self._apply_simplified(result, simplified)
+        
+        parts = (combined["classification"], key_info, rag_result, action_plan, simplified)
+        if not any("error" in part for part in parts):
+            await asyncio.to_thread(self._result_cache_set, result, cache_key)
+    
+    def _result_cache_key(self, text: str) -> str:
+        """
+        Cache key for the stage 3-7 output of one document text.
+        
+        Exact match only (modulo whitespace): results carry the recipient's
+        name, amounts and account numbers, so a similar document from the
+        same template must never be served another one's result. The agents'
+        models and prompt versions and the knowledge file's mtime/size are
+        included, so any of them changing invalidates the entry.
+        """
+        agents = (self.analyzer, self.rag_agent, self.planner, self.simplifier)
+        return make_cache_key(
+            type(self).__name__,
+            _RESULT_CACHE_VERSION,
+            *(f"{type(agent).__name__}:{agent.model}:{agent.prompt_version}" for agent in agents),
+            str(knowledge_version()),
+            " ".join(text.split())
+        )
+    
+    @staticmethod
+    def _result_cache_get(result: AnalysisResult, key: str) -> bool:
+        """Fill result from the cache; False on a miss."""
+        if not settings.llm_cache_enabled:
+            return False
+        cached = get_response_cache().get(key)
+        if cached is None:
+            return False
+        for name in _AGENT_RESULT_FIELDS:
+            setattr(result, name, cached[name])
+        return True
+    
+    @staticmethod
+    def _result_cache_set(result: AnalysisResult, key: str):
+        """Cache the stage 3-7 output of a completed run."""
+        if settings.llm_cache_enabled:
+            get_response_cache().set(
+                key, {name: getattr(result, name) for name in _AGENT_RESULT_FIELDS}
+            )
+    
+    def _combine_ocr_results(self, result: AnalysisResult, ocr_results: List[OCRResult]) -> str:
+        """Combine OCR text from all pages and record average confidence."""
+        parts = []
+        total_confidence = 0.0
+        for r in ocr_results:
+            total_confidence += r.confidence
+            # Failed pages carry an error message as text, not document content
+            if r.confidence > 0:
+                parts.append(r.text)
+        
+        result.ocr_confidence = total_confidence / len(ocr_results) if ocr_results else 0
+        return "\n\n".join(parts)
+    
+    def _apply_classification(self, result: AnalysisResult, classification: Dict[str, Any]):
+        """Copy classifier output onto the result."""
+        result.doc_type = classification.get("doc_type", "기타_공공문서")
+        result.doc_type_name = classification.get("doc_type_name", "기타 공공문서")
+        result.organization = classification.get("organization", "")
+    
+    def _apply_key_info(self, result: AnalysisResult, key_info: Dict[str, Any]):
+        """Copy extracted key info onto the result and derive risk level."""
+        result.key_info = key_info
+        result.action_required = key_info.get("action_required", False)
+        
+        # Determine risk level
+        penalty_risk = key_info.get("penalty_risk", "NONE")
+        if penalty_risk == "HIGH":
+            result.risk_level = "HIGH"
+        elif penalty_risk == "MEDIUM":
+            result.risk_level = "MEDIUM"
+        else:
+            result.risk_level = "LOW"
+    
+    def _apply_simplified(self, result: AnalysisResult, simplified: Dict[str, Any]):
+        """Copy simplifier output onto the result."""
+        result.summary_one_line = simplified.get("summary_one_line", "")
+        result.what_is_this = simplified.get("what_is_this", "")
+        result.key_points = simplified.get("key_points", [])
+        result.steps_easy = simplified.get("steps_easy", [])
+        result.risk_level = simplified.get("risk_level", result.risk_level)
+        result.dont_worry = simplified.get("dont_worry", "")
+        result.need_help_message = simplified.get("need_help_message", "")
+    
+    def _set_unreadable(self, result: AnalysisResult):
+        """Fill result for documents whose text could not be read."""
+        result.summary_one_line = "문서를 읽을 수 없습니다."
+        result.what_is_this = "이미지 품질이 좋지 않아 글자를 인식하지 못했습니다."
+        result.steps_easy = ["더 선명한 사진을 다시 찍어주세요."]
+    
+    def _set_error(self, result: AnalysisResult, error: Exception):
+        """Fill result for an analysis failure."""
+        result.summary_one_line = "문서 분석 중 오류가 발생했습니다."
+        result.what_is_this = f"오류: {str(error)}"
+        result.steps_easy = ["다시 시도해주세요."]
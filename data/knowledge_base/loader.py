@@ -5,16 +5,66 @@ Loads and indexes knowledge data into the vector store.
 Updated for v2.0 format with action guides.
 """
 import os
-import json
-from typing import List, Dict, Any
+import threading
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import orjson
 
 from config import settings
 from rag import VectorStore
 
 
+# Open stores by collection name, so searches reuse one Chroma client
+_STORES: Dict[str, VectorStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _get_store(collection_name: str) -> VectorStore:
+    """Get the shared vector store for a collection, opening it on first use."""
+    with _STORES_LOCK:
+        store = _STORES.get(collection_name)
+        if store is None:
+            store = _STORES[collection_name] = VectorStore(collection_name=collection_name)
+    return store
+
+
+@lru_cache(maxsize=4)
+def _load_json(json_path: str, mtime: float) -> Dict[str, Any]:
+    """Parse a knowledge file; mtime is part of the key so edits are picked up."""
+    with open(json_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _read_knowledge(json_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Load the knowledge file, parsed once per modification.
+    
+    The returned dict is shared between callers and must not be modified.
+    Returns None if the file does not exist.
+    """
+    if json_path is None:
+        json_path = os.path.join(settings.knowledge_dir, "knowledge_data.json")
+    
+    try:
+        mtime = os.path.getmtime(json_path)
+    except OSError:
+        return None
+    return _load_json(json_path, mtime)
+
+
+def knowledge_version(json_path: str = None) -> Optional[Tuple[int, int]]:
+    """Identify the knowledge file version as (mtime_ns, size); None if missing."""
+    if json_path is None:
+        json_path = os.path.join(settings.knowledge_dir, "knowledge_data.json")
+    
+    try:
+        stat = os.stat(json_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
 def load_knowledge_base(json_path: str = None, collection_name: str = "doc_helper_knowledge") -> int:
     """
     Load knowledge base from JSON file into vector store.
@@ -29,20 +79,18 @@ def load_knowledge_base(json_path: str = None, collection_name: str = "doc_helpe
     if json_path is None:
         json_path = os.path.join(settings.knowledge_dir, "knowledge_data.json")
     
-    if not os.path.exists(json_path):
+    data = _read_knowledge(json_path)
+    if data is None:
         print(f"Knowledge file not found: {json_path}")
         return 0
     
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
     items = data.get("knowledge_items", [])
     if not items:
         print("No knowledge items found in file")
         return 0
     
     # Initialize vector store
-    vector_store = VectorStore(collection_name=collection_name)
+    vector_store = _get_store(collection_name)
     
     # Prepare documents - include action guide in searchable text
     texts = []
@@ -77,7 +125,7 @@ def load_knowledge_base(json_path: str = None, collection_name: str = "doc_helpe
             "topic": item.get("topic", ""),
             "source_name": item.get("source_name", ""),
             "source_url": item.get("source_url", ""),
-            "action_guide": json.dumps(item.get("action_guide", {}), ensure_ascii=False)
+            "action_guide": orjson.dumps(item.get("action_guide", {})).decode()
         })
         ids.append(item.get("id", ""))
     
@@ -99,37 +147,27 @@ def get_contact_info(domain: str, json_path: str = None) -> Dict[str, Any]:
     Returns:
         Contact information dict
     """
-    if json_path is None:
-        json_path = os.path.join(settings.knowledge_dir, "knowledge_data.json")
-    
-    if not os.path.exists(json_path):
+    data = _read_knowledge(json_path)
+    if data is None:
         return {}
     
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
     contact_summary = data.get("contact_summary", {})
     return contact_summary.get(domain, {})
 
 
 def get_all_contacts(json_path: str = None) -> Dict[str, Any]:
     """Get all contact information."""
-    if json_path is None:
-        json_path = os.path.join(settings.knowledge_dir, "knowledge_data.json")
-    
-    if not os.path.exists(json_path):
+    data = _read_knowledge(json_path)
+    if data is None:
         return {}
     
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
     return data.get("contact_summary", {})
 
 
 def check_knowledge_base(collection_name: str = "doc_helper_knowledge") -> Dict[str, Any]:
     """Check current knowledge base status."""
     try:
-        vector_store = VectorStore(collection_name=collection_name)
+        vector_store = _get_store(collection_name)
         return vector_store.get_stats()
     except Exception as e:
         return {"error": str(e)}
@@ -153,8 +191,13 @@ def search_knowledge(
     Returns:
         List of search results with action guides
     """
-    vector_store = VectorStore(collection_name=collection_name)
+    vector_store = _get_store(collection_name)
     
+    # A metadata filter on the one collection, not a collection per domain:
+    # with a few dozen items the filtered query is well under a millisecond
+    # next to the embedding call, and copies would have to be kept in sync
+    # on every reload (Chroma also rejects the Korean domain names as
+    # collection names)
     filter_metadata = None
     if domain:
         filter_metadata = {"domain": domain}
@@ -165,13 +208,14 @@ def search_knowledge(
     for r in results:
         if r.get("metadata", {}).get("action_guide"):
             try:
-                r["metadata"]["action_guide"] = json.loads(r["metadata"]["action_guide"])
-            except:
+                r["metadata"]["action_guide"] = orjson.loads(r["metadata"]["action_guide"])
+            except orjson.JSONDecodeError:
                 pass
     
     return results
 
 
+# Run from the repo root with: python -m data.knowledge_base.loader
 if __name__ == "__main__":
     print("Loading knowledge base...")
     count = load_knowledge_base()
@@ -1,7 +1,8 @@
-from .embeddings import EmbeddingGenerator
+from .embeddings import EmbeddingGenerator, get_embedding_generator
 from .vector_store import VectorStore
 
 __all__ = [
     "EmbeddingGenerator",
+    "get_embedding_generator",
     "VectorStore"
 ]
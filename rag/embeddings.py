@@ -3,19 +3,32 @@ Embeddings Module
 
 Generates embeddings using OpenAI API.
 """
-import os
-from typing import List, Optional
+import base64
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
-from openai import OpenAI
+import numpy as np
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from agents.base_agent import BaseAgent
+
+
+# Texts are truncated to this many characters before embedding
+_EMBED_MAX_CHARS = 8000
+
+# Inputs per embeddings request; the API accepts up to 2048, fewer keeps
+# a request of long texts under its per-request token limit
+_EMBED_BATCH_SIZE = 512
 
 
 class EmbeddingGenerator:
     """
     Generates text embeddings using OpenAI's embedding models.
+    
+    Concurrent embed_text() calls (e.g. from parallel requests) are
+    coalesced: while one request is in flight, new texts queue up and are
+    sent together in the next one. A lone call is sent immediately.
     """
     
     def __init__(self, model: Optional[str] = None):
@@ -26,9 +39,16 @@ class EmbeddingGenerator:
             model: Embedding model to use
         """
         self.model = model or settings.embedding_model
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.dimensions = settings.embedding_dimensions
+        # Same client (and connection pool) as the agents
+        self.client = BaseAgent.get_client()
+        
+        # Texts waiting for the next request, and whether one is in flight
+        self._pending: List[Tuple[str, Future]] = []
+        self._sending = False
+        self._cond = threading.Condition()
     
-    def embed_text(self, text: str) -> List[float]:
+    def embed_text(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text.
         
@@ -38,19 +58,32 @@ class EmbeddingGenerator:
         Returns:
             Embedding vector
         """
-        # Clean and truncate text if needed
-        text = text.replace("\n", " ").strip()
-        if len(text) > 8000:
-            text = text[:8000]
+        future = Future()
+        with self._cond:
+            self._pending.append((self._clean(text), future))
         
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=text
-        )
+        # Whoever finds no request in flight sends the next batch, which
+        # holds its own text unless the queue is longer than a batch
+        while True:
+            with self._cond:
+                while self._sending and not future.done():
+                    self._cond.wait()
+                if future.done():
+                    break
+                self._sending = True
+                batch = self._pending[:_EMBED_BATCH_SIZE]
+                del self._pending[:_EMBED_BATCH_SIZE]
+            
+            try:
+                self._send_batch(batch)
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
         
-        return response.data[0].embedding
+        return future.result()
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
         """
         Generate embeddings for multiple texts.
         
@@ -60,29 +93,72 @@ class EmbeddingGenerator:
         Returns:
             List of embedding vectors
         """
-        if not texts:
-            return []
+        cleaned = [self._clean(text) for text in texts]
+        batches = [
+            cleaned[start:start + _EMBED_BATCH_SIZE]
+            for start in range(0, len(cleaned), _EMBED_BATCH_SIZE)
+        ]
+        if len(batches) <= 1:
+            return self._create(batches[0]) if batches else []
         
-        # Clean texts
-        cleaned = []
-        for text in texts:
-            t = text.replace("\n", " ").strip()
-            if len(t) > 8000:
-                t = t[:8000]
-            cleaned.append(t)
+        # Large loads send their batches concurrently; the requests are
+        # network-bound, so threads overlap them without extra processes
+        embeddings = []
+        workers = min(settings.llm_max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_embeddings in executor.map(self._create, batches):
+                embeddings.extend(batch_embeddings)
+        return embeddings
+    
+    def _send_batch(self, batch: List[Tuple[str, Future]]):
+        """Embed queued texts in one request and resolve their futures."""
+        try:
+            embeddings = self._create([text for text, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Coalesced texts come from unrelated callers; retry them one
+            # by one so a single bad input fails only its own caller
+            for item in batch:
+                self._send_batch([item])
+            return
         
-        # Batch embed (OpenAI supports batching)
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=cleaned
-        )
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+    
+    def _create(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed up to _EMBED_BATCH_SIZE cleaned texts in one API request."""
+        # Asked for explicitly, the SDK leaves base64 vectors undecoded
+        # instead of unpacking them into lists of Python floats
+        kwargs = {"model": self.model, "input": texts, "encoding_format": "base64"}
+        if self.dimensions:
+            kwargs["dimensions"] = self.dimensions
         
-        return [d.embedding for d in response.data]
+        response = self.client.embeddings.create(**kwargs)
+        
+        return [self._decode(d.embedding) for d in response.data]
+    
+    @staticmethod
+    def _decode(embedding) -> np.ndarray:
+        """Turn a base64 (or already decoded) embedding into a float32 array."""
+        if isinstance(embedding, str):
+            return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+        return np.asarray(embedding, dtype=np.float32)
+    
+    @staticmethod
+    def _clean(text: str) -> str:
+        """Flatten newlines and truncate to _EMBED_MAX_CHARS."""
+        # str.replace/strip run in C at a few ns per character; a regex
+        # whitespace collapse measured ~35x slower and holds the GIL too
+        return text.replace("\n", " ").strip()[:_EMBED_MAX_CHARS]
     
     @property
     def embedding_dimension(self) -> int:
         """Get embedding dimension for the current model."""
-        if "text-embedding-3-small" in self.model:
+        if self.dimensions:
+            return self.dimensions
+        elif "text-embedding-3-small" in self.model:
             return 1536
         elif "text-embedding-3-large" in self.model:
             return 3072
@@ -90,3 +166,16 @@ class EmbeddingGenerator:
             return 1536
         else:
             return 1536  # Default
+
+
+_EMBEDDING_GENERATOR: Optional[EmbeddingGenerator] = None
+_EMBEDDING_GENERATOR_LOCK = threading.Lock()
+
+
+def get_embedding_generator() -> EmbeddingGenerator:
+    """Get the shared generator, so concurrent callers' texts are coalesced."""
+    global _EMBEDDING_GENERATOR
+    with _EMBEDDING_GENERATOR_LOCK:
+        if _EMBEDDING_GENERATOR is None:
+            _EMBEDDING_GENERATOR = EmbeddingGenerator()
+    return _EMBEDDING_GENERATOR
@@ -9,11 +9,31 @@ import chromadb
 from chromadb.config import Settings as ChromaSettings
 import uuid
 
-import sys
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from config import settings
-from .embeddings import EmbeddingGenerator
+from agents.response_cache import TTLCache
+from .embeddings import get_embedding_generator
+
+
+# HNSW graph settings for new collections: more links per node and a wider
+# build and search beam than ChromaDB's defaults (16 / 100 / 10), trading a
+# slower build for better recall as collections such as the semantic
+# cache grow. Existing collections keep the settings they were built with
+_HNSW_M = 24
+_HNSW_CONSTRUCTION_EF = 128
+_HNSW_SEARCH_EF = 100
+
+# Metadata value types ChromaDB stores as is. Values of exactly these types
+# are checked with one set lookup; anything else goes through
+# _clean_metadata_value()
+_METADATA_TYPES = (str, int, float, bool)
+_METADATA_EXACT_TYPES = frozenset(_METADATA_TYPES)
+
+
+def _clean_metadata_value(value: Any) -> Any:
+    """Coerce a metadata value ChromaDB can't store into a primitive."""
+    if isinstance(value, _METADATA_TYPES):
+        return value
+    return "" if value is None else str(value)
 
 
 class VectorStore:
@@ -24,7 +44,11 @@ class VectorStore:
     def __init__(
         self,
         collection_name: str = "doc_helper_knowledge",
-        persist_directory: Optional[str] = None
+        persist_directory: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        hnsw_m: int = _HNSW_M,
+        hnsw_construction_ef: int = _HNSW_CONSTRUCTION_EF,
+        hnsw_search_ef: int = _HNSW_SEARCH_EF
     ):
         """
         Initialize the vector store.
@@ -32,6 +56,13 @@ class VectorStore:
         Args:
             collection_name: Name of the ChromaDB collection
             persist_directory: Directory to persist the database
+            batch_size: Documents per insert; defaults to (and is capped at)
+                the largest batch the ChromaDB client accepts
+            hnsw_m: Links per HNSW node; higher raises recall and memory
+            hnsw_construction_ef: Build-time beam width; higher raises recall
+                and indexing time
+            hnsw_search_ef: Query-time beam width; higher raises recall and
+                query latency
         """
         self.persist_directory = persist_directory or settings.vectordb_dir
         
@@ -46,21 +77,35 @@ class VectorStore:
             )
         )
         
+        # A single add() larger than this is rejected by ChromaDB
+        max_batch_size = self.client.get_max_batch_size()
+        self.batch_size = min(batch_size or max_batch_size, max_batch_size)
+        
         # Get or create collection
         self.collection_name = collection_name
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+            metadata={
+                "hnsw:space": "cosine",
+                "hnsw:M": hnsw_m,
+                "hnsw:construction_ef": hnsw_construction_ef,
+                "hnsw:search_ef": hnsw_search_ef
+            }
         )
         
-        # Initialize embedding generator
-        self.embedder = EmbeddingGenerator()
+        # Shared by all stores (knowledge base, semantic caches)
+        self.embedder = get_embedding_generator()
+        
+        # Search queries repeat (one per document type and flags), and their
+        # embeddings depend only on the text, so they outlive data changes
+        self._query_embeddings = TTLCache(settings.rag_cache_size, settings.llm_cache_ttl)
     
     def add_documents(
         self,
         texts: List[str],
         metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None
     ) -> List[str]:
         """
         Add documents to the vector store.
@@ -69,6 +114,7 @@ class VectorStore:
             texts: List of document texts
             metadatas: Optional list of metadata dicts
             ids: Optional list of document IDs
+            embeddings: Optional precomputed embeddings (skips the API call)
             
         Returns:
             List of document IDs
@@ -76,37 +122,37 @@ class VectorStore:
         if not texts:
             return []
         
-        # Generate IDs if not provided
+        # Generate IDs if not provided: one random 128-bit prefix per call,
+        # numbered per document, instead of a uuid4 per document
         if ids is None:
-            ids = [str(uuid.uuid4()) for _ in texts]
+            prefix = uuid.uuid4().hex
+            ids = [f"{prefix}-{i}" for i in range(len(texts))]
         
         # Generate embeddings
-        embeddings = self.embedder.embed_texts(texts)
-        
-        # Prepare metadatas
-        if metadatas is None:
-            metadatas = [{}] * len(texts)
-        
-        # Ensure all metadata values are JSON-serializable primitives
-        clean_metadatas = []
-        for meta in metadatas:
-            clean_meta = {}
-            for k, v in meta.items():
-                if isinstance(v, (str, int, float, bool)):
-                    clean_meta[k] = v
-                elif v is None:
-                    clean_meta[k] = ""
-                else:
-                    clean_meta[k] = str(v)
-            clean_metadatas.append(clean_meta)
-        
-        # Add to collection
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=clean_metadatas
-        )
+        if embeddings is None:
+            embeddings = self.embedder.embed_texts(texts)
+        
+        # Ensure all metadata values are JSON-serializable primitives. No
+        # metadata is passed as None: ChromaDB rejects empty metadata dicts
+        clean_metadatas = None
+        if metadatas is not None:
+            clean_metadatas = [
+                {
+                    k: v if type(v) in _METADATA_EXACT_TYPES else _clean_metadata_value(v)
+                    for k, v in meta.items()
+                }
+                for meta in metadatas
+            ]
+        
+        # Add to collection, in as few calls as ChromaDB allows
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            self.collection.add(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=texts[start:end],
+                metadatas=clean_metadatas[start:end] if clean_metadatas is not None else None
+            )
         
         return ids
     
@@ -114,7 +160,8 @@ class VectorStore:
         self,
         query: str,
         n_results: int = 5,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Search for similar documents.
@@ -123,12 +170,17 @@ class VectorStore:
             query: Search query text
             n_results: Number of results to return
             filter_metadata: Optional metadata filter
+            query_embedding: Optional precomputed query embedding
             
         Returns:
             List of search results with text, metadata, and score
         """
         # Generate query embedding
-        query_embedding = self.embedder.embed_text(query)
+        if query_embedding is None:
+            query_embedding = self._query_embeddings.get(query)
+            if query_embedding is None:
+                query_embedding = self.embedder.embed_text(query)
+                self._query_embeddings.set(query, query_embedding)
         
         # Perform search
         results = self.collection.query(
@@ -137,36 +189,125 @@ class VectorStore:
             where=filter_metadata
         )
         
-        # Format results
-        formatted_results = []
-        if results['ids'] and results['ids'][0]:
-            for i in range(len(results['ids'][0])):
-                formatted_results.append({
-                    "id": results['ids'][0][i],
-                    "text": results['documents'][0][i] if results['documents'] else "",
-                    "metadata": results['metadatas'][0][i] if results['metadatas'] else {},
-                    "distance": results['distances'][0][i] if results['distances'] else 0.0,
-                    "score": 1 - results['distances'][0][i] if results['distances'] else 1.0
-                })
-        
-        return formatted_results
+        return self._format_results(results, 0)
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries in one ChromaDB call.
+        
+        Args:
+            queries: Search query texts
+            n_results: Number of results to return per query
+            filter_metadata: Optional metadata filter, shared by all queries
+            query_embeddings: Optional precomputed query embeddings
+            
+        Returns:
+            One list of search results per query, as returned by search()
+        """
+        if not queries:
+            return []
+        
+        # Embed the uncached queries in one request
+        if query_embeddings is None:
+            query_embeddings = [self._query_embeddings.get(q) for q in queries]
+            missing = [i for i, embedding in enumerate(query_embeddings) if embedding is None]
+            if missing:
+                embeddings = self.embedder.embed_texts([queries[i] for i in missing])
+                for i, embedding in zip(missing, embeddings):
+                    query_embeddings[i] = embedding
+                    self._query_embeddings.set(queries[i], embedding)
+        
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=filter_metadata
+        )
+        
+        return [self._format_results(results, row) for row in range(len(queries))]
+    
+    @staticmethod
+    def _format_results(results: Dict[str, Any], row: int) -> List[Dict[str, Any]]:
+        """Format one query's hits, resolving the optional fields once rather than per hit."""
+        if not (results['ids'] and results['ids'][row]):
+            return []
+        
+        ids = results['ids'][row]
+        documents = results['documents'][row] if results['documents'] else [""] * len(ids)
+        metadatas = results['metadatas'][row] if results['metadatas'] else [{} for _ in ids]
+        distances = results['distances'][row] if results['distances'] else [0.0] * len(ids)
+        
+        return [
+            {
+                "id": doc_id,
+                "text": text,
+                "metadata": metadata,
+                "distance": distance,
+                "score": 1 - distance
+            }
+            for doc_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+        ]
+    
+    def warmup(self):
+        """
+        Load the collection's HNSW index with a throwaway query.
+        
+        ChromaDB reads the index from disk on the first query; doing it here
+        keeps that load off the first request.
+        """
+        # Query with a stored vector: it has the index's dimension (which may
+        # not be the current embedding settings') and a non-zero norm
+        stored = self.collection.get(limit=1, include=["embeddings"])
+        if stored['ids']:
+            self.collection.query(query_embeddings=[stored['embeddings'][0]], n_results=1)
+    
+    def cache_query_embeddings(self, queries: List[str]):
+        """Embed the uncached queries in one request, ahead of their searches."""
+        missing = [q for q in dict.fromkeys(queries) if self._query_embeddings.get(q) is None]
+        if not missing:
+            return
+        
+        for query, embedding in zip(missing, self.embedder.embed_texts(missing)):
+            self._query_embeddings.set(query, embedding)
     
     def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific document by ID."""
-        results = self.collection.get(ids=[doc_id])
+        return self.get_documents([doc_id]).get(doc_id)
+    
+    def get_documents(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get several documents by ID in one ChromaDB call.
         
-        if results['ids']:
-            return {
-                "id": results['ids'][0],
-                "text": results['documents'][0] if results['documents'] else "",
-                "metadata": results['metadatas'][0] if results['metadatas'] else {}
-            }
-        return None
+        Returns:
+            Documents keyed by ID; IDs that don't exist are left out
+        """
+        if not doc_ids:
+            return {}
+        
+        results = self.collection.get(ids=doc_ids)
+        
+        ids = results['ids']
+        documents = results['documents'] or [""] * len(ids)
+        metadatas = results['metadatas'] or [{} for _ in ids]
+        
+        return {
+            doc_id: {"id": doc_id, "text": text, "metadata": metadata}
+            for doc_id, text, metadata in zip(ids, documents, metadatas)
+        }
     
     def delete_document(self, doc_id: str):
         """Delete a document by ID."""
         self.collection.delete(ids=[doc_id])
     
+    def delete_where(self, filter_metadata: Dict[str, Any]):
+        """Delete the documents matching a metadata filter."""
+        self.collection.delete(where=filter_metadata)
+    
     def delete_collection(self):
         """Delete the entire collection."""
         self.client.delete_collection(self.collection_name)
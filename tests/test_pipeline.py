@@ -9,6 +9,159 @@ import pytest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+class TestBaseAgent:
+    """Test cases for shared agent behavior."""
+    
+    def test_agents_share_client(self):
+        """Test that all agents reuse one OpenAI client."""
+        from agents import DocumentClassifier, Simplifier
+        
+        classifier = DocumentClassifier()
+        simplifier = Simplifier()
+        assert classifier.client is simplifier.client
+        assert classifier.async_client is simplifier.async_client
+    
+    def test_response_schema(self):
+        """Test that agent schemas are strict and list every field as required."""
+        from agents import CombinedAnalyzer, Simplifier
+        from agents.base_agent import BaseAgent
+        
+        for agent_cls in (CombinedAnalyzer, Simplifier):
+            schema = agent_cls.response_format["json_schema"]["schema"]
+            assert agent_cls.response_format["json_schema"]["strict"] is True
+            assert set(schema["required"]) == set(schema["properties"])
+        
+        assert BaseAgent._parse_json('{"a": 1}') == {"a": 1}
+        assert "error" in BaseAgent._parse_json("not json")
+    
+    def test_loop_semaphore(self):
+        """Test that the request limiter works across separate event loops."""
+        import asyncio
+        from agents.base_agent import LoopSemaphore
+        
+        semaphore = LoopSemaphore(2)
+        active = []
+        
+        async def task():
+            async with semaphore:
+                active.append(1)
+                assert len(active) <= 2
+                await asyncio.sleep(0.01)
+                active.pop()
+        
+        async def run():
+            await asyncio.gather(*(task() for _ in range(5)))
+        
+        # The second run would fail with a semaphore bound to the first loop
+        asyncio.run(run())
+        asyncio.run(run())
+    
+    def test_truncate_to_tokens(self):
+        """Test that long input is cut and short input is left alone."""
+        from agents.base_agent import BaseAgent
+        
+        assert BaseAgent._truncate_to_tokens("건강보험료 고지서", 100) == "건강보험료 고지서"
+        
+        truncated = BaseAgent._truncate_to_tokens("건강보험료 " * 1000, 100)
+        assert 0 < len(truncated) < len("건강보험료 " * 1000)
+        assert "건강보험료 ".startswith(truncated[:6])
+    
+    def test_completed_fields(self):
+        """Test that only fully streamed top-level fields are parsed."""
+        from agents.base_agent import BaseAgent
+        
+        partial = '{"summary_one_line": "납부하세요", "risk_level": "HI'
+        assert BaseAgent._completed_fields(partial) == {"summary_one_line": "납부하세요"}
+        
+        # The number may still be growing
+        assert BaseAgent._completed_fields('{"confidence": 0.9') == {}
+        assert BaseAgent._completed_fields('{"confidence": 0.95}') == {"confidence": 0.95}
+
+
+class TestResponseCache:
+    """Test cases for the exact-match LLM response cache."""
+    
+    def test_cache_roundtrip(self, tmp_path):
+        """Test that stored responses are returned for the same key."""
+        from agents.response_cache import ResponseCache, make_cache_key
+        
+        cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"), ttl=60)
+        key = make_cache_key("gpt-4o-mini", "system", "user")
+        
+        assert cache.get(key) is None
+        cache.set(key, {"doc_type": "건강보험료_고지서"})
+        assert cache.get(key) == {"doc_type": "건강보험료_고지서"}
+        
+        # A different model must not hit the same entry
+        assert cache.get(make_cache_key("gpt-4o", "system", "user")) is None
+    
+    def test_cache_purge(self, tmp_path):
+        """Test that expired responses are deleted, not just skipped."""
+        from agents.response_cache import ResponseCache
+        
+        cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"), ttl=60)
+        cache.set("old", {"a": 1})
+        cache.set("new", {"a": 2})
+        cache._conn.execute("UPDATE responses SET created_at = 0 WHERE key = 'old'")
+        
+        cache.purge_expired()
+        keys = [row[0] for row in cache._conn.execute("SELECT key FROM responses")]
+        assert keys == ["new"]
+    
+    def test_semantic_cache_hides_text(self, tmp_path, monkeypatch):
+        """Test that the semantic cache stores a hash, not the document text."""
+        from agents.response_cache import SemanticCache
+        from config import settings
+        
+        monkeypatch.setattr(settings, "vectordb_dir", str(tmp_path))
+        cache = SemanticCache("test")
+        cache.store("홍길동 님 건강보험료 150,000원", "gpt-4o-mini", {"doc_type": "건강보험료_고지서"}, [1.0, 0.0])
+        
+        documents = cache.vector_store.list_all_documents()
+        assert len(documents) == 1
+        assert "홍길동" not in documents[0]["text"]
+    
+    def test_text_call_cache(self, tmp_path, monkeypatch):
+        """Test that plain-text LLM calls are served from the cache."""
+        from types import SimpleNamespace
+        from agents import base_agent, Simplifier
+        from agents.response_cache import ResponseCache
+        
+        cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"), ttl=60)
+        monkeypatch.setattr(base_agent, "get_response_cache", lambda: cache)
+        monkeypatch.setattr(base_agent.settings, "llm_cache_enabled", True)
+        
+        calls = []
+        
+        def create(**kwargs):
+            calls.append(kwargs)
+            message = SimpleNamespace(content="돈을 내세요.")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        simplifier = Simplifier()
+        simplifier.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        assert simplifier.simplify_text("납부하시기 바랍니다.") == "돈을 내세요."
+        assert simplifier.simplify_text("납부하시기 바랍니다.") == "돈을 내세요."
+        assert len(calls) == 1
+    
+    def test_ttl_cache_eviction(self):
+        """Test LRU eviction and expiry of the in-memory cache."""
+        from agents.response_cache import TTLCache
+        
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        
+        expired = TTLCache(maxsize=2, ttl=-1)
+        expired.set("a", 1)
+        assert expired.get("a") is None
+
+
 class TestDocumentClassifier:
     """Test cases for document classifier agent."""
     
@@ -27,12 +180,38 @@ class TestDocumentClassifier:
         classifier = DocumentClassifier()
         
         # Test health insurance keywords
-        matches = classifier._keyword_match("건강보험료 납부 고지서")
+        matches = classifier.keyword_match("건강보험료 납부 고지서")
         assert len(matches) > 0
         
         # Test pension keywords
-        matches = classifier._keyword_match("국민연금공단 지급 안내")
+        matches = classifier.keyword_match("국민연금공단 지급 안내")
         assert len(matches) > 0
+    
+    def test_keyword_only_classification(self):
+        """Test that only unambiguous keyword matches skip the LLM."""
+        from agents import DocumentClassifier
+        
+        classifier = DocumentClassifier()
+        
+        result = classifier._keyword_classify("국민건강보험공단 건강보험료 납부 안내")
+        assert result["doc_type"] == "건강보험료_고지서"
+        assert result["organization"] == "국민건강보험공단"
+        
+        # 수급 belongs to both pension and welfare documents
+        assert classifier._keyword_classify("국민연금 수급 안내") is None
+        assert classifier._keyword_classify("납부 안내") is None
+    
+    def test_keyword_compound_word(self):
+        """Test that keywords inside one compound word count once."""
+        from agents import DocumentClassifier
+        
+        classifier = DocumentClassifier()
+        
+        # 건강보험료 holds 건강보험 and 보험료; 국민연금공단 holds 국민연금 and 연금공단
+        assert classifier._keyword_counts("건강보험료 관련 일반 안내") == {"건강보험료_고지서": 1}
+        assert classifier._keyword_classify("건강보험료 관련 일반 안내") is None
+        assert classifier._keyword_classify("국민연금공단 홍보 행사 안내") is None
+        assert classifier._keyword_classify("우리 아파트 관리비 절약 캠페인") is None
 
 
 class TestInfoExtractor:
@@ -58,6 +237,232 @@ class TestInfoExtractor:
         text = "문의: 1577-1000"
         results = extractor._extract_with_rules(text)
         assert len(results["phones"]) > 0
+        
+        # Test account extraction keeps only the number
+        text = "가상계좌: 123-4567-89"
+        results = extractor._extract_with_rules(text)
+        assert results["accounts"] == ["123-4567-89"]
+    
+    def test_regex_ocr_spaces(self):
+        """Test that OCR's NBSP and ideographic spaces still separate fields."""
+        from agents import InfoExtractor
+        
+        extractor = InfoExtractor()
+        
+        results = extractor._extract_with_rules("납부금액\xa0150,000\xa0원")
+        assert results["amounts"] == ["납부금액\xa0150,000\xa0원"]
+        
+        results = extractor._extract_with_rules("2024년\u30003월\u300015일")
+        assert results["dates"] == ["2024년\u30003월\u300015일"]
+        
+        results = extractor._extract_with_rules("전화\u3000 02-1234-5678")
+        assert results["phones"] == ["전화\u3000 02-1234-5678"]
+
+
+class TestCombinedAnalyzer:
+    """Test cases for the fused classifier + extractor agent."""
+    
+    def test_split_result(self):
+        """Test that a fused response splits into both agents' shapes."""
+        from agents import CombinedAnalyzer
+        
+        analyzer = CombinedAnalyzer()
+        combined = analyzer._split_result({
+            "doc_type": "건강보험료_고지서",
+            "doc_type_name": "건강보험료 고지서",
+            "confidence": 0.9,
+            "organization": "국민건강보험공단",
+            "amount": "150,000원",
+            "penalty_risk": "HIGH",
+            "action_required": True
+        })
+        
+        assert combined["classification"]["doc_type"] == "건강보험료_고지서"
+        assert "amount" not in combined["classification"]
+        assert combined["key_info"]["amount"] == "150,000원"
+        assert combined["key_info"]["organization"] == "국민건강보험공단"
+        assert combined["key_info"]["due_date"] is None
+    
+    def test_split_result_error(self, monkeypatch):
+        """Test that an unparseable fused response stays an error and isn't cached."""
+        from agents import base_agent, CombinedAnalyzer
+        
+        monkeypatch.setattr(base_agent.settings, "llm_cache_enabled", False)
+        monkeypatch.setattr(base_agent.settings, "semantic_cache_enabled", True)
+        
+        analyzer = CombinedAnalyzer()
+        stored = []
+        monkeypatch.setattr(analyzer.classifier, "quick_classify", lambda text: (None, [0.1, 0.2]))
+        monkeypatch.setattr(analyzer.classifier.semantic_cache, "store", lambda *a, **kw: stored.append(a))
+        monkeypatch.setattr(analyzer, "_call_llm", lambda **kwargs: '{"doc_type": "세금_통')
+        
+        combined = analyzer.process("알 수 없는 문서")
+        assert "error" in combined["classification"]
+        assert "error" in combined["key_info"]
+        assert stored == []
+
+
+class TestActionPlanner:
+    """Test cases for action planner agent."""
+    
+    def test_completed_steps(self):
+        """Test that only fully streamed steps are parsed from a partial response."""
+        from agents import ActionPlanner
+        
+        partial = '{"action_type": "PAY", "steps": ["1단계: 납부하기", "2단계: 확'
+        assert ActionPlanner._completed_steps(partial) == ["1단계: 납부하기"]
+        assert ActionPlanner._completed_steps('{"action_type": "PA') == []
+    
+    def test_determine_action_type(self):
+        """Test the per-document-type default actions."""
+        from agents import ActionPlanner, ActionType
+        
+        planner = ActionPlanner()
+        assert planner._determine_action_type("공과금_고지서", {"amount": "5,000원"}) == ActionType.PAY
+        assert planner._determine_action_type("공과금_고지서", {}) == ActionType.CHECK
+        assert planner._determine_action_type("법원_통지서", {}) == ActionType.URGENT
+        assert planner._determine_action_type("복지_안내문", {}) == ActionType.NONE
+
+
+class TestSimplifier:
+    """Test cases for simplifier agent."""
+    
+    def test_format_action_guide(self):
+        """Test that the first guide with a contact channel is used."""
+        from agents import Simplifier
+        from agents.rag_agent import RAGAgent
+        
+        assert RAGAgent._parse_action_guide("not json") == {}
+        chunks = [
+            {"action_guide": RAGAgent._parse_action_guide("{}")},
+            {"action_guide": RAGAgent._parse_action_guide('{"phone": {"number": "1577-1000"}}')}
+        ]
+        
+        guide = Simplifier._format_action_guide({"retrieved_chunks": chunks})
+        assert "1577-1000" in guide
+        assert Simplifier._format_action_guide({"retrieved_chunks": chunks[:1]}) == ""
+    
+    def test_defaults_not_shared(self):
+        """Test that results filled with defaults don't share their lists."""
+        from agents import Simplifier
+        
+        first = Simplifier._ensure_fields({"summary_one_line": "납부하세요"})
+        first["steps_easy"].append("은행에 가세요.")
+        first["help_channels"]["phone"] = "129"
+        
+        second = Simplifier._ensure_fields({})
+        assert second["steps_easy"] == ["자세히 읽어보세요."]
+        assert second["help_channels"] == {}
+        assert first["summary_one_line"] == "납부하세요"
+
+
+class TestVisionOCR:
+    """Test cases for the Vision OCR engine."""
+    
+    def test_ocr_result_cache(self, tmp_path, monkeypatch):
+        """Test that an identical image is only sent to the model once."""
+        from types import SimpleNamespace
+        from PIL import Image
+        from agents.response_cache import ResponseCache
+        from core import ocr_engine
+        
+        cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"), ttl=60)
+        monkeypatch.setattr(ocr_engine, "get_response_cache", lambda: cache)
+        
+        calls = []
+        
+        def create(**kwargs):
+            calls.append(kwargs)
+            message = SimpleNamespace(content="건강보험료 고지서")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        engine = ocr_engine.VisionOCREngine()
+        engine.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        image = Image.new("RGB", (64, 64), "white")
+        first = engine.extract_from_pil_image(image)
+        second = engine.extract_from_pil_image(image)
+        
+        assert len(calls) == 1
+        assert second == first
+        assert second.text == "건강보험료 고지서"
+
+
+class TestAPI:
+    """Test cases for API helpers."""
+    
+    def test_sniff_file_type(self):
+        """Test that uploads are recognized by content, not by name."""
+        from api.main import sniff_file_type
+        
+        assert sniff_file_type(b"%PDF-1.7\n%\xe2\xe3") == ".pdf"
+        assert sniff_file_type(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR") == ".png"
+        assert sniff_file_type(b"\xff\xd8\xff\xe0\x00\x10JFIF") == ".jpg"
+        assert sniff_file_type(b"RIFF\x24\x00\x00\x00WEBPVP8 ") == ".webp"
+        
+        # A renamed executable is rejected
+        assert sniff_file_type(b"MZ\x90\x00\x03\x00\x00\x00") is None
+        assert sniff_file_type(b"") is None
+    
+    def test_contacts_follow_knowledge_file(self, tmp_path, monkeypatch):
+        """Test that /contacts picks up file edits and doesn't cache the fallback."""
+        import orjson
+        from fastapi.testclient import TestClient
+        from api import main
+        from config import settings
+        from data.knowledge_base import loader
+        
+        monkeypatch.setattr(settings, "knowledge_dir", str(tmp_path))
+        monkeypatch.setattr(main, "_contacts_cache", None)
+        knowledge_file = tmp_path / "knowledge_data.json"
+        
+        def write_contacts(phone, mtime):
+            knowledge_file.write_bytes(orjson.dumps({"contact_summary": {"국민연금공단": {"phone": phone}}}))
+            os.utime(knowledge_file, (mtime, mtime))
+        
+        write_contacts("1355", 1_000_000)
+        assert b"1355" in main.render_contacts()[0]
+        
+        write_contacts("1355-0000", 2_000_000)
+        assert b"1355-0000" in main.render_contacts()[0]
+        
+        def fail():
+            raise OSError("unreadable")
+        
+        write_contacts("1355", 3_000_000)
+        get_all_contacts = loader.get_all_contacts
+        monkeypatch.setattr(loader, "get_all_contacts", fail)
+        body, etag = main.render_contacts()
+        assert b"1577-1000" in body and etag is None
+        response = TestClient(main.app).get("/contacts")
+        assert response.headers["cache-control"] == "no-store"
+        assert "etag" not in response.headers
+        
+        monkeypatch.setattr(loader, "get_all_contacts", get_all_contacts)
+        assert b"1577-1000" not in main.render_contacts()[0]
+    
+    def test_load_history_skips_torn_lines(self, tmp_path, monkeypatch):
+        """Test that one partial line doesn't discard the whole history."""
+        from api import main
+        
+        history_file = tmp_path / "history.jsonl"
+        history_file.write_bytes(b'{"id": "a"}\n{"id": "b"}\n{"id": "c", "resu')
+        monkeypatch.setattr(main, "HISTORY_FILE", str(history_file))
+        monkeypatch.setattr(main, "analysis_history", main.analysis_history)
+        
+        main.load_history()
+        assert [h["id"] for h in main.analysis_history] == ["b", "a"]
+        assert history_file.read_bytes() == b'{"id":"a"}\n{"id":"b"}\n'
+    
+    def test_history_limit_validated(self):
+        """Test that an out-of-range history limit is rejected, not a 500."""
+        from fastapi.testclient import TestClient
+        from api import main
+        
+        client = TestClient(main.app)
+        assert client.get("/history", params={"limit": 0}).status_code == 200
+        assert client.get("/history", params={"limit": -1}).status_code == 422
+        assert client.get("/history", params={"limit": main.HISTORY_LIMIT + 1}).status_code == 422
 
 
 class TestPipeline:
@@ -73,6 +478,80 @@ class TestPipeline:
         assert pipeline.extractor is not None
         assert pipeline.planner is not None
         assert pipeline.simplifier is not None
+    
+    def test_failed_analysis_not_cached(self, monkeypatch):
+        """Test that a result built on a failed LLM call isn't cached."""
+        from core import DocumentAnalysisPipeline
+        from core.pipeline import AnalysisResult
+        
+        pipeline = DocumentAnalysisPipeline()
+        stored = []
+        monkeypatch.setattr(pipeline, "_result_cache_get", lambda result, key: False)
+        monkeypatch.setattr(pipeline, "_result_cache_set", lambda result, key: stored.append(key))
+        monkeypatch.setattr(pipeline.rag_agent, "process", lambda **kwargs: {"retrieved_chunks": []})
+        monkeypatch.setattr(pipeline.planner, "process", lambda **kwargs: {"steps": []})
+        monkeypatch.setattr(pipeline.simplifier, "process", lambda **kwargs: {"summary_one_line": "안내문"})
+        
+        classification = {"doc_type": "기타_공공문서", "doc_type_name": "기타 공공문서"}
+        monkeypatch.setattr(pipeline.analyzer, "process", lambda **kwargs: {
+            "classification": {**classification, "error": "Failed to parse JSON"},
+            "key_info": {"penalty_risk": "NONE", "error": "Failed to parse JSON"}
+        })
+        pipeline._run_agents(AnalysisResult(), "알 수 없는 문서")
+        assert stored == []
+        
+        monkeypatch.setattr(pipeline.analyzer, "process", lambda **kwargs: {
+            "classification": classification,
+            "key_info": {"penalty_risk": "NONE"}
+        })
+        pipeline._run_agents(AnalysisResult(), "알 수 없는 문서")
+        assert len(stored) == 1
+
+
+class TestEmbeddings:
+    """Test cases for the embedding generator."""
+    
+    def test_concurrent_embed_text_coalesced(self):
+        """Test that concurrent single-text calls share requests and get their own vectors."""
+        import time
+        from types import SimpleNamespace
+        from concurrent.futures import ThreadPoolExecutor
+        from rag.embeddings import EmbeddingGenerator
+        
+        generator = EmbeddingGenerator()
+        requests = []
+        failed = []
+        callers = 40
+        
+        def create(input, **kwargs):
+            requests.append(len(input))
+            # Hold the first request until every other caller has queued
+            deadline = time.monotonic() + 5
+            while len(requests) == 1 and requests[0] + len(generator._pending) < callers and time.monotonic() < deadline:
+                time.sleep(0.001)
+            if "실패" in input:
+                failed.append(len(input))
+                raise RuntimeError("API error")
+            data = [SimpleNamespace(embedding=[float(text[1:])]) for text in input]
+            return SimpleNamespace(data=data)
+        
+        generator.client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        
+        with ThreadPoolExecutor(max_workers=40) as executor:
+            vectors = list(executor.map(generator.embed_text, [f"t{i}" for i in range(40)]))
+        assert [float(v[0]) for v in vectors] == [float(i) for i in range(40)]
+        assert len(requests) == 2 and sum(requests) == 40
+        
+        # A bad text fails only its own caller, not the batch it shared
+        requests.clear()
+        callers = 10
+        texts = [f"t{i}" for i in range(9)] + ["실패"]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            futures = [executor.submit(generator.embed_text, text) for text in texts]
+        assert [float(f.result()[0]) for f in futures[:9]] == [float(i) for i in range(9)]
+        with pytest.raises(RuntimeError):
+            futures[9].result()
+        assert max(failed) > 1
 
 
 class TestVectorStore:
@@ -87,6 +566,26 @@ class TestVectorStore:
         
         stats = store.get_stats()
         assert "collection_name" in stats
+    
+    def test_search_batch(self, tmp_path):
+        """Test that a batch search returns one result list per query."""
+        from rag import VectorStore
+        
+        store = VectorStore(collection_name="test_batch", persist_directory=str(tmp_path))
+        store.add_documents(
+            ["연금", "건강보험"],
+            ids=["a", "b"],
+            embeddings=[[1.0, 0.0], [0.0, 1.0]]
+        )
+        
+        results = store.search_batch(
+            ["q1", "q2"],
+            n_results=1,
+            query_embeddings=[[0.9, 0.1], [0.1, 0.9]]
+        )
+        assert [r[0]["id"] for r in results] == ["a", "b"]
+        assert results[1][0]["text"] == "건강보험"
+        assert store.search_batch([]) == []
 
 
 if __name__ == "__main__":
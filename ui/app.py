@@ -11,8 +11,11 @@ import streamlit as st
 from PIL import Image
 import io
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add parent directory to path for imports; Streamlit re-executes this
+# file on every rerun, so only add it once
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
 
 # Page config
 st.set_page_config(
@@ -40,35 +43,37 @@ FONT_SIZES = {
 
 fs = FONT_SIZES[st.session_state.font_size]
 
-# Custom CSS for accessibility
-st.markdown(f"""
+# Custom CSS for accessibility. The stylesheet itself is static and sized
+# through CSS variables, so a font size change only rewrites the small
+# :root block below it
+_STYLESHEET = """
 <style>
     /* Large, readable fonts */
-    .main h1 {{
-        font-size: {fs['h1']} !important;
+    .main h1 {
+        font-size: var(--font-h1) !important;
         font-weight: bold !important;
         color: #1a1a1a !important;
         text-align: center;
         margin-bottom: 1rem;
-    }}
+    }
     
-    .main h2 {{
-        font-size: {fs['h2']} !important;
+    .main h2 {
+        font-size: var(--font-h2) !important;
         font-weight: 600 !important;
         color: #333 !important;
-    }}
+    }
     
-    .main h3 {{
-        font-size: calc({fs['h2']} - 0.2rem) !important;
-    }}
+    .main h3 {
+        font-size: calc(var(--font-h2) - 0.2rem) !important;
+    }
     
-    .main p, .main li {{
-        font-size: {fs['p']} !important;
+    .main p, .main li {
+        font-size: var(--font-p) !important;
         line-height: 1.8 !important;
-    }}
+    }
     
     /* Summary card styles */
-    .summary-card {{
+    .summary-card {
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
         padding: 2rem;
         border-radius: 1rem;
@@ -76,135 +81,153 @@ st.markdown(f"""
         text-align: center;
         margin: 1rem 0;
         box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }}
+    }
     
-    .summary-card h2 {{
+    .summary-card h2 {
         color: white !important;
-        font-size: {fs['h2']} !important;
+        font-size: var(--font-h2) !important;
         margin-bottom: 0.5rem;
-    }}
+    }
     
-    .summary-card p {{
-        font-size: {fs['step']} !important;
-    }}
+    .summary-card p {
+        font-size: var(--font-step) !important;
+    }
     
     /* Risk level badges */
-    .risk-low {{
+    .risk-low {
         background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
         color: white;
         padding: 0.5rem 1.5rem;
         border-radius: 2rem;
         display: inline-block;
         font-weight: bold;
-        font-size: {fs['p']};
-    }}
+        font-size: var(--font-p);
+    }
     
-    .risk-medium {{
+    .risk-medium {
         background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
         color: white;
         padding: 0.5rem 1.5rem;
         border-radius: 2rem;
         display: inline-block;
         font-weight: bold;
-        font-size: {fs['p']};
-    }}
+        font-size: var(--font-p);
+    }
     
-    .risk-high {{
+    .risk-high {
         background: linear-gradient(135deg, #eb3349 0%, #f45c43 100%);
         color: white;
         padding: 0.5rem 1.5rem;
         border-radius: 2rem;
         display: inline-block;
         font-weight: bold;
-        font-size: {fs['p']};
+        font-size: var(--font-p);
         animation: pulse 2s infinite;
-    }}
+    }
     
-    @keyframes pulse {{
-        0% {{ transform: scale(1); }}
-        50% {{ transform: scale(1.05); }}
-        100% {{ transform: scale(1); }}
-    }}
+    @keyframes pulse {
+        0% { transform: scale(1); }
+        50% { transform: scale(1.05); }
+        100% { transform: scale(1); }
+    }
     
     /* Step cards */
-    .step-card {{
+    .step-card {
         background: white;
         border: 2px solid #e0e0e0;
         border-radius: 1rem;
         padding: 1.5rem;
         margin: 0.8rem 0;
-        font-size: {fs['step']} !important;
+        font-size: var(--font-step) !important;
         box-shadow: 0 2px 10px rgba(0,0,0,0.05);
         transition: transform 0.2s;
-    }}
+    }
     
-    .step-card:hover {{
+    .step-card:hover {
         transform: translateX(5px);
         border-color: #667eea;
-    }}
+    }
     
     /* Contact cards */
-    .contact-card {{
+    .contact-card {
         background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
         border-radius: 1rem;
         padding: 1.5rem;
         margin: 0.5rem 0;
-        font-size: {fs['p']};
-    }}
+        font-size: var(--font-p);
+    }
     
-    .contact-card .phone {{
-        font-size: calc({fs['h2']} + 0.3rem);
+    .contact-card .phone {
+        font-size: calc(var(--font-h2) + 0.3rem);
         font-weight: bold;
         color: #4CAF50;
-    }}
+    }
     
     /* Upload area */
-    .uploadfile {{
+    .uploadfile {
         border: 3px dashed #667eea !important;
         border-radius: 1rem !important;
         padding: 2rem !important;
-    }}
+    }
     
     /* Buttons */
-    .stButton > button {{
-        font-size: {fs['p']} !important;
+    .stButton > button {
+        font-size: var(--font-p) !important;
         padding: 0.8rem 2rem !important;
         border-radius: 0.8rem !important;
-    }}
+    }
     
     /* Don't worry section */
-    .dont-worry {{
+    .dont-worry {
         background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%);
         padding: 1.5rem;
         border-radius: 1rem;
         margin: 1rem 0;
-        font-size: {fs['p']};
-    }}
+        font-size: var(--font-p);
+    }
     
     /* History item */
-    .history-item {{
+    .history-item {
         background: #f8f9fa;
         border-left: 4px solid #667eea;
         padding: 1rem;
         margin: 0.5rem 0;
         border-radius: 0 0.5rem 0.5rem 0;
         cursor: pointer;
-    }}
+    }
     
-    .history-item:hover {{
+    .history-item:hover {
         background: #e9ecef;
-    }}
+    }
     
     /* Sidebar */
-    .css-1d391kg {{
-        font-size: {fs['p']} !important;
-    }}
+    .css-1d391kg {
+        font-size: var(--font-p) !important;
+    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_STYLESHEET, unsafe_allow_html=True)
+st.markdown(
+    f"<style>:root {{ --font-h1: {fs['h1']}; --font-h2: {fs['h2']}; "
+    f"--font-p: {fs['p']}; --font-step: {fs['step']}; }}</style>",
+    unsafe_allow_html=True
+)
 
 # API endpoint
 API_URL = os.environ.get("API_URL", "http://localhost:8001")
 
+
+@st.cache_resource
+def _session() -> requests.Session:
+    """HTTP session shared across reruns, keeping API connections alive."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 # Default contacts (fallback)
 DEFAULT_CONTACTS = {
     "국민연금공단": {"phone": "1355", "website": "https://www.nps.or.kr", "hours": "평일 09:00-18:00"},
@@ -213,33 +236,41 @@ DEFAULT_CONTACTS = {
     "국세상담센터": {"phone": "126", "website": "https://www.hometax.go.kr", "hours": "평일 09:00-18:00"}
 }
 
+# Badge text and CSS class per risk level
+RISK_MESSAGES = {
+    "LOW": ("✅ 안심하세요", "risk-low"),
+    "MEDIUM": ("⚠️ 확인이 필요해요", "risk-medium"),
+    "HIGH": ("🚨 중요한 문서예요", "risk-high")
+}
+
 
 def get_risk_badge(risk_level: str) -> str:
     """Generate HTML for risk level badge."""
-    risk_messages = {
-        "LOW": ("✅ 안심하세요", "risk-low"),
-        "MEDIUM": ("⚠️ 확인이 필요해요", "risk-medium"),
-        "HIGH": ("🚨 중요한 문서예요", "risk-high")
-    }
-    message, css_class = risk_messages.get(risk_level, ("확인 필요", "risk-medium"))
+    message, css_class = RISK_MESSAGES.get(risk_level, ("확인 필요", "risk-medium"))
     return f'<span class="{css_class}">{message}</span>'
 
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_contacts():
+    """Fetch contacts once per five minutes instead of on every rerun."""
+    response = _session().get(f"{API_URL}/contacts", timeout=5)
+    response.raise_for_status()
+    return response.json().get("contacts", DEFAULT_CONTACTS)
+
+
 def get_contacts():
     """Get contacts from API."""
+    # Failures raise out of the cached fetch, so the fallback isn't cached
     try:
-        response = requests.get(f"{API_URL}/contacts", timeout=5)
-        if response.status_code == 200:
-            return response.json().get("contacts", DEFAULT_CONTACTS)
+        return _fetch_contacts()
     except:
-        pass
-    return DEFAULT_CONTACTS
+        return DEFAULT_CONTACTS
 
 
 def get_history():
     """Get history from API."""
     try:
-        response = requests.get(f"{API_URL}/history?limit=10", timeout=5)
+        response = _session().get(f"{API_URL}/history?limit=10", timeout=5)
         if response.status_code == 200:
             return response.json().get("history", [])
     except:
@@ -419,7 +450,7 @@ def main():
                     use_container_width=True
                 ):
                     try:
-                        response = requests.get(f"{API_URL}/history/{item['id']}", timeout=10)
+                        response = _session().get(f"{API_URL}/history/{item['id']}", timeout=10)
                         if response.status_code == 200:
                             result_data = response.json()
                             if result_data.get("status") == "success":
@@ -493,9 +524,11 @@ def main():
         if st.button("🔍 문서 분석하기", use_container_width=True, type="primary"):
             with st.spinner("📝 문서를 분석하고 있어요... 잠시만 기다려주세요..."):
                 try:
-                    # Send to API
-                    files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                    response = requests.post(f"{API_URL}/analyze_document", files=files, timeout=120)
+                    # Send to API; hand over the upload buffer itself instead
+                    # of a getvalue() copy (st.image may have moved its position)
+                    uploaded_file.seek(0)
+                    files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
+                    response = _session().post(f"{API_URL}/analyze_document", files=files, timeout=120)
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -525,7 +558,7 @@ def main():
             if text_input.strip():
                 with st.spinner("분석 중..."):
                     try:
-                        response = requests.post(
+                        response = _session().post(
                             f"{API_URL}/analyze_text",
                             json={"text": text_input},
                             timeout=120